@@ -1,30 +1,307 @@
 import os
+import io
+import bisect
+import codecs
+import cProfile
+import hashlib
+import click
+import json
+import multiprocessing
+import queue
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unicodedata
+import zipfile
+import zlib
+from array import array
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from difflib import SequenceMatcher
-from datetime import datetime
-from flask import Flask, render_template, redirect, url_for, request, session, flash, send_file
+from datetime import datetime, timezone
+from flask import Flask, render_template, redirect, url_for, request, session, flash, send_file, jsonify, g, make_response
+from flask import has_app_context, has_request_context, before_render_template, template_rendered
+from werkzeug.local import LocalProxy
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from markupsafe import Markup
 import sqlite3
-from functools import wraps
+from functools import lru_cache, wraps
+from xml.etree import ElementTree
+
+try:
+    import numpy as np
+except ImportError:  # batch scoring falls back to per-pair loops
+    np = None
 
 # Initialize Flask App
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ASSIGNMENTS_FOLDER'] = 'assignments'
-app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB limit
+app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB limit; scoring still holds whole texts
+app.config['READ_CHUNK_SIZE'] = 64 * 1024  # bytes per read when streaming uploads
+app.config['EXTRACT_SPOOL_SIZE'] = 8 * 1024 * 1024  # unseekable .docx streams spill to disk above this
 app.config['DATABASE'] = 'app.db'
+app.config['DB_POOL_SIZE'] = 8  # idle connections kept for requests and job workers
+app.config['ASGI_THREADS'] = 6  # requests run at once per asgi.py process; with JOB_WORKERS this fills DB_POOL_SIZE
+app.config['DB_BUSY_TIMEOUT'] = 10.0  # seconds to wait for a write lock
+app.config['DB_CACHED_STATEMENTS'] = 256  # prepared statements kept per connection
+app.config['DB_MMAP_SIZE'] = 256 * 1024 * 1024
+app.config['MIGRATION_BATCH_SIZE'] = 500  # rows rewritten per transaction by data migrations
+app.config['TEXT_CACHE_SIZE'] = 256  # extracted texts kept in memory
+app.config['BLOB_CACHE_SIZE'] = 64  # decompressed comparison texts kept in memory
+app.config['BLOB_COMPRESSION_LEVEL'] = 6  # zlib level for stored text blobs
+app.config['SHINGLE_SIZE'] = 5  # tokens per shingle
+app.config['FOLD_DIACRITICS'] = True  # match 'öğrenci' with 'ogrenci' when tokenizing
+app.config['TOKEN_CACHE_SIZE'] = 1024  # token streams kept in memory
+app.config['MINHASH_PERMUTATIONS'] = 128
+app.config['LSH_BANDS'] = 64  # 64 bands x 2 rows, catches pairs from ~0.15 Jaccard
+app.config['CANDIDATE_LIMIT'] = 10  # exact scores computed per examine view
+app.config['NEIGHBOR_COUNT'] = 10  # most similar peers stored per submission
+app.config['RISK_PAIR_LIMIT'] = 10  # pairs in the dashboard's highest-risk panel
+app.config['SIMILARITY_ENGINE'] = 'auto'  # default when an assignment has none
+app.config['SEQUENCE_MAX_TOKENS'] = 2000  # 'auto' uses difflib only below this
+app.config['SEQUENCE_LIMIT_TOKENS'] = 30000  # 'sequence' falls back to winnowing above this
+app.config['DIFF_MAX_STEPS'] = 200000  # 'bounded_diff' falls back once its diff needs more steps
+app.config['WINNOW_K'] = 15  # characters per k-gram
+app.config['WINNOW_WINDOW'] = 8  # k-grams (token shingles for the engine) per winnowing window
+app.config['CORPUS_WINNOW_K'] = 20  # sparser fingerprints for the corpus-wide index
+app.config['CORPUS_WINNOW_WINDOW'] = 20
+app.config['CORPUS_SEARCH_LIMIT'] = 20
+app.config['ALIGN_SEED_WORDS'] = 5  # words per alignment seed
+app.config['ALIGN_MIN_WORDS'] = 8  # shortest passage reported as a match
+app.config['ALIGN_MAX_SEED_HITS'] = 20  # seeds repeated more often are boilerplate
+app.config['ANALYSIS_WORKERS'] = None  # None = one process per core
+app.config['EXTRACTION_WORKERS'] = 4  # threads reading and extracting texts for one request or job
+app.config['ANALYSIS_POOL_MIN_PAIRS'] = 50  # smaller jobs are scored inline
+app.config['IMPORT_BATCH_SIZE'] = 200  # submissions per transaction in import-submissions
+app.config['ANALYSIS_MIN_CONTAINMENT'] = 0.01  # pairs sharing fewer shingles are pruned
+app.config['VECTOR_DIMENSIONS'] = 1 << 32  # hashed shingle space for term vectors
+app.config['VECTOR_CACHE_SIZE'] = 1024
+app.config['VECTOR_DENSE_DF'] = 64  # terms in more documents than this are multiplied out as a dense block
+app.config['VECTOR_STEP_SIZE'] = 1 << 20  # document pairs or matrix cells handled per vectorized step
+app.config['JOB_WORKERS'] = 2  # background job threads
+app.config['JOB_POLL_INTERVAL'] = 2.0  # seconds between queue polls when idle
+app.config['JOB_MAX_ATTEMPTS'] = 3
+app.config['JOB_STALE_SECONDS'] = 600  # running jobs silent this long are requeued
+app.config['JOB_HEARTBEAT_INTERVAL'] = 30  # seconds between liveness updates of a running job
+app.config['JOBS_INLINE'] = False  # run jobs in the calling thread (tests, CLI)
+app.config['COMPARE_INLINE_MAX_CHARS'] = 100000  # larger ad-hoc comparisons are queued
+app.config['PAGE_SIZE'] = 50  # rows per page in history and submission listings
+app.config['CACHE_TTL'] = 60  # seconds a cached dashboard query or fragment stays valid
+app.config['CACHE_SIZE'] = 512  # cached dashboard entries kept in memory
+app.config['USER_CACHE_SIZE'] = 4096  # user records kept in memory
+app.config['METRICS_ENABLED'] = True
+app.config['METRICS_BUCKETS'] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # bearer token for /metrics when set
+app.config['PROFILE_SLOW_REQUESTS'] = False  # dump cProfile stats for slow requests
+app.config['PROFILE_THRESHOLD'] = 1.0  # seconds
+app.config['PROFILE_FOLDER'] = 'profiles'
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # werkzeug method and cost
+app.config['LOGIN_RATE_LIMIT'] = 300  # attempts per address per window; a classroom shares one NAT address
+app.config['LOGIN_RATE_WINDOW'] = 60  # seconds
+app.config['LOGIN_MAX_FAILURES'] = 5  # failed attempts per username per window
+app.config['LOGIN_FAILURE_WINDOW'] = 300  # seconds
+app.config['LOGIN_TRACKED_KEYS'] = 10000  # addresses and usernames remembered per limiter
 
 # Ensure upload folders exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['ASSIGNMENTS_FOLDER'], exist_ok=True)
 
+# Metrics
+# Requests, extraction, similarity, SQL statements and template rendering
+# are timed into per-route histograms and served at /metrics in the
+# Prometheus text format. Work outside a request is labelled 'background'.
+METRIC_DESCRIPTIONS = {
+    'request': 'Request handling time',
+    'extraction': 'Text extraction time per document',
+    'similarity': 'Similarity scoring time per call',
+    'db_query': 'SQLite statement execution time',
+    'template_render': 'Template rendering time',
+    'password_hash': 'Password hashing and verification time',
+}
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # per bucket, made cumulative on export
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+metrics = {}  # (metric, route) -> Histogram
+metrics_lock = threading.Lock()
+
+def metrics_route():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+def observe(name, seconds):
+    if not app.config['METRICS_ENABLED']:
+        return
+    key = (name, metrics_route())
+    with metrics_lock:
+        histogram = metrics.get(key)
+        if histogram is None:
+            histogram = metrics[key] = Histogram(app.config['METRICS_BUCKETS'])
+        histogram.observe(seconds)
+
+@contextmanager
+def timed(name):
+    # Usable as a context manager or as a function decorator
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Times statement execution; rows fetched after the first step of a
+    # cursor are not included
+    def execute(self, *args, **kwargs):
+        with timed('db_query'):
+            return super().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with timed('db_query'):
+            return super().executemany(*args, **kwargs)
+
+def render_metrics():
+    with metrics_lock:
+        snapshot = sorted(
+            (name, route, histogram.buckets, list(histogram.counts), histogram.count, histogram.total)
+            for (name, route), histogram in metrics.items()
+        )
+    lines = []
+    for name in sorted({row[0] for row in snapshot}):
+        metric = f'plagiarism_{name}_seconds'
+        lines.append(f'# HELP {metric} {METRIC_DESCRIPTIONS.get(name, name)}')
+        lines.append(f'# TYPE {metric} histogram')
+        for metric_name, route, buckets, counts, count, total in snapshot:
+            if metric_name != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{route="{route}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{route="{route}"}} {total}')
+            lines.append(f'{metric}_count{{route="{route}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+def dump_profile(profiler, elapsed):
+    os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
+    path = os.path.join(
+        app.config['PROFILE_FOLDER'],
+        f"{datetime.now():%Y%m%d_%H%M%S}_{request.endpoint or 'unmatched'}_{int(elapsed * 1000)}ms.prof"
+    )
+    profiler.dump_stats(path)
+    app.logger.warning(f"Slow request {request.path} took {elapsed:.2f}s, profile saved to {path}")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if app.config['PROFILE_SLOW_REQUESTS']:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError:  # another profiler is already active in this thread
+            pass
+
+@app.after_request
+def record_request_time(response):
+    observe('request', time.perf_counter() - g.get('request_started', time.perf_counter()))
+    return response
+
+@app.teardown_request
+def stop_request_profiler(exception):
+    # Runs even when the view raised, so the profiler never outlives its request
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+        if elapsed >= app.config['PROFILE_THRESHOLD']:
+            dump_profile(profiler, elapsed)
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        observe('template_render', time.perf_counter() - started)
+
 # Database Helper Functions
-def get_db():
-    db = sqlite3.connect(app.config['DATABASE'])
+def connect_db():
+    # Connections move between request and worker threads through the pool,
+    # but only one thread uses a connection at a time
+    db = sqlite3.connect(
+        app.config['DATABASE'],
+        timeout=app.config['DB_BUSY_TIMEOUT'],
+        cached_statements=app.config['DB_CACHED_STATEMENTS'],
+        check_same_thread=False,
+        factory=InstrumentedConnection
+    )
     db.row_factory = sqlite3.Row
+    # WAL lets dashboard reads run while an upload or job is writing
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute(f"PRAGMA mmap_size = {int(app.config['DB_MMAP_SIZE'])}")
     return db
 
+class ConnectionPool:
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect_db()
+
+    def release(self, db):
+        if db.in_transaction:
+            db.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(db)
+        else:
+            db.close()
+
+db_pool = ConnectionPool(app.config['DB_POOL_SIZE'])
+
+def get_db():
+    # One connection per application context (request, job or CLI command)
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exception):
+    db = g.pop('db', None)
+    if db is not None:
+        db_pool.release(db)
+
+def add_column_if_missing(db, table, column, definition):
+    columns = [row['name'] for row in db.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
 def init_db():
     with app.app_context():
         db = get_db()
@@ -71,6 +348,302 @@ def init_db():
             )
         ''')
         db.commit()
+        migrate_db(db)
+
+# Schema Migrations
+# Each migration runs once, in order; PRAGMA user_version records the last one
+# applied. Migrations stay idempotent so databases created before versioning
+# (tables made with IF NOT EXISTS, version 0) upgrade cleanly.
+MIGRATIONS = {}
+
+def migration(version):
+    def decorator(f):
+        MIGRATIONS[version] = f
+        return f
+    return decorator
+
+def migrate_db(db):
+    current = db.execute('PRAGMA user_version').fetchone()[0]
+    for version in sorted(MIGRATIONS):
+        if version <= current:
+            continue
+        MIGRATIONS[version](db)
+        db.execute(f'PRAGMA user_version = {int(version)}')
+        db.commit()
+
+@migration(1)
+def create_text_store(db):
+    # Extracted text store, keyed by the SHA-256 of the file bytes
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS document_texts (
+            content_hash TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    add_column_if_missing(db, 'submissions', 'content_hash', 'TEXT')
+    add_column_if_missing(db, 'assignments', 'content_hash', 'TEXT')
+
+@migration(2)
+def create_fingerprint_index(db):
+    # MinHash signatures and LSH buckets for candidate retrieval
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS submission_signatures (
+            submission_id INTEGER PRIMARY KEY,
+            assignment_id INTEGER NOT NULL,
+            signature BLOB NOT NULL,
+            FOREIGN KEY (submission_id) REFERENCES submissions (id),
+            FOREIGN KEY (assignment_id) REFERENCES assignments (id)
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            assignment_id INTEGER NOT NULL,
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            submission_id INTEGER NOT NULL,
+            PRIMARY KEY (assignment_id, band, bucket, submission_id)
+        ) WITHOUT ROWID
+    ''')
+
+@migration(3)
+def add_similarity_engine(db):
+    add_column_if_missing(db, 'assignments', 'similarity_engine', 'TEXT')
+
+@migration(4)
+def create_similarity_scores(db):
+    # Precomputed pairwise scores per assignment (submission1_id < submission2_id)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS similarity_scores (
+            assignment_id INTEGER NOT NULL,
+            submission1_id INTEGER NOT NULL,
+            submission2_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            engine TEXT NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (submission1_id, submission2_id),
+            FOREIGN KEY (assignment_id) REFERENCES assignments (id),
+            FOREIGN KEY (submission1_id) REFERENCES submissions (id),
+            FOREIGN KEY (submission2_id) REFERENCES submissions (id)
+        )
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_similarity_scores_submission2
+        ON similarity_scores (submission2_id, score)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_similarity_scores_assignment
+        ON similarity_scores (assignment_id, score)
+    ''')
+    add_column_if_missing(db, 'assignments', 'analyzed_at', 'TIMESTAMP')
+
+@migration(5)
+def create_jobs(db):
+    # Background job queue
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            job_key TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            result TEXT,
+            error TEXT,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (job_key, status)')
+
+@migration(6)
+def add_scored_at(db):
+    add_column_if_missing(db, 'submissions', 'scored_at', 'TIMESTAMP')
+
+@migration(7)
+def add_listing_indexes(db):
+    # Filters and sort orders used by the dashboards, examine and history
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_submissions_assignment
+        ON submissions (assignment_id, submitted_at, id)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_submissions_student
+        ON submissions (student_id, submitted_at, id)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_submissions_submitted
+        ON submissions (submitted_at, id)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_assignments_teacher
+        ON assignments (teacher_id, created_at)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_assignments_created
+        ON assignments (created_at)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_comparisons_created
+        ON comparisons (created_at, id)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_comparisons_user
+        ON comparisons (user_id, created_at, id)
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_role
+        ON users (role, username)
+    ''')
+    db.execute('ANALYZE')
+
+@migration(8)
+def create_text_blobs(db):
+    # Comparison texts are stored once, compressed, and referenced by hash
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS text_blobs (
+            content_hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    add_column_if_missing(db, 'comparisons', 'text1_hash', 'TEXT')
+    add_column_if_missing(db, 'comparisons', 'text2_hash', 'TEXT')
+    
+    # Move the texts of existing comparisons into the blob store, a batch
+    # at a time; an interrupted run resumes with the rows still inline
+    last_id = 0
+    while True:
+        rows = db.execute(
+            '''SELECT id, text1, text2 FROM comparisons
+               WHERE id > ? AND (text1 IS NOT NULL OR text2 IS NOT NULL)
+               ORDER BY id LIMIT ?''',
+            (last_id, app.config['MIGRATION_BATCH_SIZE'])
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            hashes = []
+            for text in (row['text1'] or "", row['text2'] or ""):
+                data = text.encode('utf-8')
+                hashes.append(hashlib.sha256(data).hexdigest())
+                db.execute(
+                    'INSERT OR IGNORE INTO text_blobs (content_hash, data, size) VALUES (?, ?, ?)',
+                    (hashes[-1], zlib.compress(data), len(data))
+                )
+            db.execute(
+                'UPDATE comparisons SET text1_hash = ?, text2_hash = ?, text1 = NULL, text2 = NULL WHERE id = ?',
+                (hashes[0], hashes[1], row['id'])
+            )
+        db.commit()
+        last_id = rows[-1]['id']
+
+@migration(9)
+def create_corpus_index(db):
+    # Inverted index from winnowing fingerprints to every submission ever made
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS fingerprint_postings (
+            fingerprint INTEGER NOT NULL,
+            submission_id INTEGER NOT NULL,
+            PRIMARY KEY (fingerprint, submission_id)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS fingerprint_documents (
+            submission_id INTEGER PRIMARY KEY,
+            fingerprint_count INTEGER NOT NULL,
+            FOREIGN KEY (submission_id) REFERENCES submissions (id)
+        )
+    ''')
+
+@migration(10)
+def create_passage_alignments(db):
+    # Cached matching passages per submission pair (submission1_id < submission2_id)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS passage_alignments (
+            submission1_id INTEGER NOT NULL,
+            submission2_id INTEGER NOT NULL,
+            spans TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (submission1_id, submission2_id),
+            FOREIGN KEY (submission1_id) REFERENCES submissions (id),
+            FOREIGN KEY (submission2_id) REFERENCES submissions (id)
+        )
+    ''')
+
+@migration(11)
+def create_submission_neighbors(db):
+    # Each submission's NEIGHBOR_COUNT most similar peers, kept in sync with
+    # similarity_scores by refresh_neighbors
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS submission_neighbors (
+            submission_id INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            assignment_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (submission_id, neighbor_id),
+            FOREIGN KEY (submission_id) REFERENCES submissions (id),
+            FOREIGN KEY (neighbor_id) REFERENCES submissions (id)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_submission_neighbors_assignment
+        ON submission_neighbors (assignment_id, score)
+    ''')
+    db.execute('''
+        INSERT OR IGNORE INTO submission_neighbors (submission_id, neighbor_id, assignment_id, score)
+        SELECT submission_id, neighbor_id, assignment_id, score FROM (
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY submission_id ORDER BY score DESC, neighbor_id
+            ) AS rank
+            FROM (
+                SELECT submission1_id AS submission_id, submission2_id AS neighbor_id, assignment_id, score
+                FROM similarity_scores
+                UNION ALL
+                SELECT submission2_id, submission1_id, assignment_id, score
+                FROM similarity_scores
+            )
+        )
+        WHERE rank <= ?
+    ''', (app.config['NEIGHBOR_COUNT'],))
+
+@migration(12)
+def create_token_streams(db):
+    # Preprocessed token ids (array('I') bytes) keyed by the SHA-256 of the
+    # text; rows from an older pipeline are rebuilt on first use or by
+    # `flask index-tokens`
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS token_streams (
+            text_hash TEXT PRIMARY KEY,
+            pipeline TEXT NOT NULL,
+            token_count INTEGER NOT NULL,
+            tokens BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migration(13)
+def add_active_job_key_index(db):
+    # At most one queued or running job per key, so concurrent enqueues
+    # cannot both insert; duplicates queued before this keep running unkeyed
+    db.execute('''
+        UPDATE jobs SET job_key = NULL
+        WHERE job_key IS NOT NULL AND status IN ('queued', 'running')
+          AND id NOT IN (
+              SELECT MIN(id) FROM jobs
+              WHERE job_key IS NOT NULL AND status IN ('queued', 'running')
+              GROUP BY job_key
+          )
+    ''')
+    db.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_key ON jobs (job_key)
+        WHERE job_key IS NOT NULL AND status IN ('queued', 'running')
+    ''')
 
 # Initialize Database
 init_db()
@@ -92,25 +665,1420 @@ def datetimeformat(value, format='%d.%m.%Y %H:%M'):
 def inject_current_year():
     return {'current_year': datetime.now().year}
 
+# Small thread-safe LRU used in front of the persistent stores
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+text_cache = LRUCache(app.config['TEXT_CACHE_SIZE'])
+blob_cache = LRUCache(app.config['BLOB_CACHE_SIZE'])
+
+# Query Cache
+# Dashboard query results and rendered fragments are kept for CACHE_TTL
+# seconds, tagged by the data they read. A write bumps its tag's version,
+# which retires every entry stored under the old one. Each process has its
+# own cache, so with several workers the TTL bounds how stale a page gets.
+CACHE_INSTANCE = os.urandom(8).hex()
+
+class QueryCache:
+    def __init__(self, maxsize, ttl):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)
+        self._versions = {}
+        self._modified = {}
+        self._lock = threading.Lock()
+        self._started = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def versions(self, tags):
+        with self._lock:
+            return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def last_modified(self, tags):
+        with self._lock:
+            return max(self._modified.get(tag, self._started) for tag in tags)
+
+    def get_or_set(self, key, tags, compute):
+        # Versions are read before computing, so a write that lands while the
+        # value is being built leaves it already stale
+        versions = self.versions(tags)
+        entry = self._entries.get(key)
+        if entry and entry[0] == versions and entry[1] > time.monotonic():
+            return entry[2]
+        value = compute()
+        self._entries.set(key, (versions, time.monotonic() + self.ttl, value))
+        return value
+
+    def invalidate(self, *tags):
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                self._modified[tag] = now
+
+query_cache = QueryCache(app.config['CACHE_SIZE'], app.config['CACHE_TTL'])
+
+def cached_query(key, tags, sql, params=()):
+    return query_cache.get_or_set(key, tags, lambda: get_db().execute(sql, params).fetchall())
+
+# Text Preprocessing
+# Engines compare token streams, not raw text: NFKC-normalized, lower-cased
+# the Turkish way (I -> ı, İ -> i), optionally stripped of diacritics, split
+# into words with punctuation and stopwords dropped. Each word becomes a
+# stable 32-bit id; a text's ids are stored once as array('I') bytes, keyed
+# by the SHA-256 of the text, and shared by every engine.
+TOKEN_PIPELINE_VERSION = 1  # bump when tokenization changes; older streams are rebuilt
+COMBINING_MARKS = re.compile(r'[\u0300-\u036f]+')
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+_SHINGLE_MULTIPLIER = 0x100000001b3  # 64-bit FNV prime
+_MASK64 = (1 << 64) - 1
+STOPWORDS = frozenset('''
+    acaba ama ancak artık aslında az bazı belki ben beni benim bile bir biraz biri birkaç
+    biz bize bizi bizim bu buna bunda bundan bunlar bunları bunların bunu bunun burada çok
+    çünkü da daha de diye eğer en gibi hem hep hepsi her hiç için ile ise kez ki kim mı mi
+    mu mü nasıl ne neden nerede niçin niye o olan olarak ona onda ondan onlar onları onların
+    onu onun orada öyle sanki şey siz size sizi sizin şu şuna şunda şundan şunlar şunu şunun
+    tüm ve veya ya yani
+    a an and are as at be by for from in is it of on or that the this to was were with
+'''.split())
+
+def normalize_text(text, fold=None):
+    if fold is None:
+        fold = app.config['FOLD_DIACRITICS']
+    text = unicodedata.normalize('NFKC', text).replace('I', 'ı').replace('İ', 'i').lower()
+    if fold:
+        # ç -> c, ş -> s, ğ -> g, ö -> o, ü -> u, â -> a; ı has no decomposition
+        text = COMBINING_MARKS.sub('', unicodedata.normalize('NFD', text)).replace('ı', 'i')
+    return text
+
+@lru_cache(maxsize=None)
+def normalized_stopwords(fold):
+    return frozenset(normalize_text(word, fold) for word in STOPWORDS)
+
+@lru_cache(maxsize=1 << 16)
+def token_id(word):
+    return hash_shingle(word)
+
+def tokenize(text):
+    fold = app.config['FOLD_DIACRITICS']
+    stopwords = normalized_stopwords(fold)
+    return array('I', [
+        token_id(word) for word in TOKEN_PATTERN.findall(normalize_text(text, fold))
+        if word not in stopwords
+    ])
+
+def token_pipeline():
+    return f"v{TOKEN_PIPELINE_VERSION}{'-fold' if app.config['FOLD_DIACRITICS'] else ''}"
+
+token_cache = LRUCache(app.config['TOKEN_CACHE_SIZE'])
+text_hash_cache = LRUCache(app.config['TOKEN_CACHE_SIZE'])  # id(text) -> (text, hash)
+
+def text_hash(text):
+    # The same str object is hashed once; an entry keeps its text alive, so
+    # the id cannot be reused by another string while it is cached
+    entry = text_hash_cache.get(id(text))
+    if entry is not None and entry[0] is text:
+        return entry[1]
+    content_hash = hash_content(text.encode('utf-8'))
+    text_hash_cache.set(id(text), (text, content_hash))
+    return content_hash
+
+def read_token_stream(db, content_hash):
+    row = db.execute(
+        'SELECT tokens FROM token_streams WHERE text_hash = ? AND pipeline = ?',
+        (content_hash, token_pipeline())
+    ).fetchone()
+    return load_signature(row['tokens']) if row else None
+
+def write_token_stream(db, content_hash, tokens):
+    db.execute(
+        'INSERT OR REPLACE INTO token_streams (text_hash, pipeline, token_count, tokens) VALUES (?, ?, ?, ?)',
+        (content_hash, token_pipeline(), len(tokens), tokens.tobytes())
+    )
+
+def token_stream(text, content_hash=None):
+    # LRU, then SQLite, then the tokenizer; outside an app context (scoring
+    # processes, scripts) streams are only kept in memory. A new row joins
+    # the caller's transaction and is saved when the caller commits.
+    content_hash = content_hash or text_hash(text)
+    tokens = token_cache.get(content_hash)
+    if tokens is None:
+        if has_app_context():
+            db = get_db()
+            tokens = read_token_stream(db, content_hash)
+            if tokens is None:
+                tokens = tokenize(text)
+                write_token_stream(db, content_hash, tokens)
+        else:
+            tokens = tokenize(text)
+        token_cache.set(content_hash, tokens)
+    return tokens
+
+def token_shingles(tokens, size=None):
+    # Hashes of every run of `size` token ids, or of the whole stream when
+    # it is shorter; the numpy path and the loop give identical values
+    size = size or app.config['SHINGLE_SIZE']
+    if not tokens:
+        return array('I')
+    count = max(len(tokens) - size + 1, 1)
+    span = min(size, len(tokens))
+    if np is not None:
+        ids = np.frombuffer(tokens, dtype=np.uint32).astype(np.uint64)
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(span):
+            hashes = hashes * np.uint64(_SHINGLE_MULTIPLIER) + ids[offset:offset + count]
+        hashes ^= hashes >> np.uint64(32)
+        return array('I', hashes.astype(np.uint32).tobytes())
+    hashes = array('I')
+    for start in range(count):
+        h = 0
+        for value in tokens[start:start + span]:
+            h = (h * _SHINGLE_MULTIPLIER + value) & _MASK64
+        hashes.append((h ^ (h >> 32)) & _MAX_HASH)
+    return hashes
+
+def prepare_token_streams(db, texts):
+    # Read or build the streams of texts about to be scored and commit the
+    # new ones, so the write lock is not held while scoring runs
+    streams = {}
+    for text in texts:
+        content_hash = text_hash(text)
+        streams[content_hash] = token_stream(text, content_hash)
+    db.commit()
+    return streams
+
+def shingle_set(text):
+    return set(token_shingles(token_stream(text)))
+
+def backfill_token_streams():
+    db = get_db()
+    rows = db.execute('SELECT content_hash FROM document_texts').fetchall()
+    built = 0
+    for row in rows:
+        text = get_indexed_text(row['content_hash']) or ""
+        content_hash = text_hash(text)
+        if read_token_stream(db, content_hash) is None:
+            write_token_stream(db, content_hash, tokenize(text))
+            db.commit()
+            built += 1
+    return built
+
+@app.cli.command('index-tokens')
+def index_tokens_command():
+    """Build missing or outdated token streams for every stored document."""
+    click.echo(f'{backfill_token_streams()} belge için kelime dizisi oluşturuldu')
+
+# Similarity Engines
+# Each engine returns a ratio in [0, 1]; calculate_similarity turns it into a
+# percentage. Assignments pick an engine by name.
+class SimilarityEngine:
+    name = None
+    label = None
+    complexity = None
+
+    def score(self, text1, text2):
+        raise NotImplementedError
+
+    def score_many(self, text, others):
+        return [self.score(text, other) for other in others]
+
+    def score_matrix(self, texts):
+        # Upper triangle is filled; vectorized engines override this
+        matrix = [[0.0] * len(texts) for _ in texts]
+        for i, text in enumerate(texts):
+            for j, score in enumerate(self.score_many(text, texts[i + 1:]), start=i + 1):
+                matrix[i][j] = matrix[j][i] = score
+        return matrix
+
+SIMILARITY_ENGINES = {}
+
+def register_engine(engine_class):
+    SIMILARITY_ENGINES[engine_class.name] = engine_class()
+    return engine_class
+
+def get_engine(name=None):
+    return SIMILARITY_ENGINES.get(name) or SIMILARITY_ENGINES[app.config['SIMILARITY_ENGINE']]
+
+def normalize_for_winnowing(text):
+    return re.sub(r'[\W_]+', '', text.lower())
+
+class WinnowBuilder:
+    # Winnowing over a text fed in pieces of any size; only the last k-1
+    # characters, a trailing partial word and one window of hashes are kept
+    # between pieces
+    def __init__(self, k=None, window=None):
+        self.k = k or app.config['WINNOW_K']
+        self.window = window or app.config['WINNOW_WINDOW']
+        self.reset()
+
+    def reset(self):
+        self.carry = ''
+        self.tail = ''
+        self.count = 0  # k-gram hashes seen so far
+        self.smallest = None  # used when the text has fewer than `window` k-grams
+        self.minima = deque()  # (index, hash), hashes increasing
+        self.result = set()
+
+    def update(self, piece):
+        # Pieces are lower-cased at word boundaries, as the whole text would
+        # be (final sigma depends on the next character)
+        text = self.carry + piece
+        self.carry = ''
+        if text and not text[-1].isspace():
+            word = text.rsplit(None, 1)[-1]
+            if len(word) < app.config['READ_CHUNK_SIZE']:
+                text, self.carry = text[:len(text) - len(word)], word
+        self._consume(normalize_for_winnowing(text))
+
+    def _consume(self, normalized):
+        k, window, minima = self.k, self.window, self.minima
+        normalized = self.tail + normalized
+        for start in range(len(normalized) - k + 1):
+            h = zlib.crc32(normalized[start:start + k].encode('utf-8'))
+            i = self.count
+            self.count += 1
+            # Rightmost minimum of every window, tracked with a monotonic deque
+            while minima and minima[-1][1] >= h:
+                minima.pop()
+            minima.append((i, h))
+            if minima[0][0] <= i - window:
+                minima.popleft()
+            if i >= window - 1:
+                self.result.add(minima[0][1])
+            elif self.smallest is None or h < self.smallest:
+                self.smallest = h
+        self.tail = normalized[max(0, len(normalized) - k + 1):] if k > 1 else ''
+
+    def fingerprints(self):
+        if self.carry:
+            self._consume(normalize_for_winnowing(self.carry))
+            self.carry = ''
+        if not self.count:
+            return {zlib.crc32(self.tail.encode('utf-8'))} if self.tail else set()
+        if self.count < self.window:
+            return {self.smallest}
+        return self.result
+
+def winnow_fingerprints(text, k=None, window=None):
+    builder = WinnowBuilder(k, window)
+    builder.update(text)
+    return builder.fingerprints()
+
+def token_fingerprints(text, window=None):
+    # Winnowing over the token shingles: the minimum of every window
+    window = window or app.config['WINNOW_WINDOW']
+    hashes = token_shingles(token_stream(text))
+    if len(hashes) <= window:
+        return {min(hashes)} if hashes else set()
+    if np is not None:
+        windows = np.lib.stride_tricks.sliding_window_view(np.frombuffer(hashes, dtype=np.uint32), window)
+        return set(windows.min(axis=1).tolist())
+    return {min(hashes[start:start + window]) for start in range(len(hashes) - window + 1)}
+
+@register_engine
+class SequenceEngine(SimilarityEngine):
+    name = 'sequence'
+    label = 'Kelime Dizisi (difflib)'
+    complexity = 'O(n*m)'
+
+    def score(self, text1, text2):
+        # SequenceMatcher's memory grows with the text; large documents are
+        # compared by fingerprints instead
+        tokens1, tokens2 = token_stream(text1), token_stream(text2)
+        if max(len(tokens1), len(tokens2)) > app.config['SEQUENCE_LIMIT_TOKENS']:
+            return SIMILARITY_ENGINES['winnowing'].score(text1, text2)
+        # No autojunk: in a token stream the frequent words are content, not noise
+        return SequenceMatcher(None, tokens1.tolist(), tokens2.tolist(), autojunk=False).ratio()
+
+@register_engine
+class JaccardEngine(SimilarityEngine):
+    name = 'jaccard'
+    label = 'Kelime Öbekleri (Jaccard)'
+    complexity = 'O(n+m)'
+
+    def score(self, text1, text2):
+        shingles1, shingles2 = shingle_set(text1), shingle_set(text2)
+        if not shingles1 or not shingles2:
+            return 0.0
+        return len(shingles1 & shingles2) / len(shingles1 | shingles2)
+
+@register_engine
+class ContainmentEngine(SimilarityEngine):
+    name = 'containment'
+    label = 'Kelime Öbekleri (Kapsama)'
+    complexity = 'O(n+m)'
+
+    def score(self, text1, text2):
+        shingles1, shingles2 = shingle_set(text1), shingle_set(text2)
+        if not shingles1 or not shingles2:
+            return 0.0
+        return len(shingles1 & shingles2) / min(len(shingles1), len(shingles2))
+
+    def score_many(self, text, others):
+        if np is None:
+            return super().score_many(text, others)
+        return one_vs_many(term_vector(text), [term_vector(other) for other in others], 'containment').tolist()
+
+    def score_matrix(self, texts):
+        if np is None:
+            return super().score_matrix(texts)
+        return many_vs_many([term_vector(text) for text in texts], 'containment').tolist()
+
+@register_engine
+class CosineEngine(SimilarityEngine):
+    name = 'cosine'
+    label = 'Terim Vektörleri (Kosinüs)'
+    complexity = 'O(n+m), vectorized'
+
+    def score(self, text1, text2):
+        return self.score_many(text1, [text2])[0]
+
+    def score_many(self, text, others):
+        if np is None:
+            return [cosine_fallback(text, other) for other in others]
+        return one_vs_many(term_vector(text), [term_vector(other) for other in others], 'cosine').tolist()
+
+    def score_matrix(self, texts):
+        if np is None:
+            return super().score_matrix(texts)
+        return many_vs_many([term_vector(text) for text in texts], 'cosine').tolist()
+
+@register_engine
+class WinnowingEngine(SimilarityEngine):
+    name = 'winnowing'
+    label = 'Parmak İzi (Winnowing)'
+    complexity = 'O(n+m)'
+
+    def score(self, text1, text2):
+        fingerprints1, fingerprints2 = token_fingerprints(text1), token_fingerprints(text2)
+        if not fingerprints1 or not fingerprints2:
+            return 0.0
+        return 2 * len(fingerprints1 & fingerprints2) / (len(fingerprints1) + len(fingerprints2))
+
+def bounded_edit_distance(a, b, max_steps):
+    # Myers' O((n+m)D) diff: the fewest insertions and deletions turning a
+    # into b, or None once more than max_steps diagonal moves and matched
+    # tokens have been spent
+    n, m = len(a), len(b)
+    offset = n + m + 1
+    furthest = [0] * (2 * offset + 1)  # furthest x reached on each diagonal k = x - y
+    steps = 0
+    for d in range(n + m + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and furthest[offset + k - 1] < furthest[offset + k + 1]):
+                x = furthest[offset + k + 1]
+            else:
+                x = furthest[offset + k - 1] + 1
+            y = x - k
+            start = x
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            furthest[offset + k] = x
+            steps += x - start + 1
+            if x >= n and y >= m:
+                return d
+            if steps > max_steps:
+                return None
+    return n + m
+
+@register_engine
+class BoundedDiffEngine(SimilarityEngine):
+    name = 'bounded_diff'
+    label = 'Kelime Farkı (Sınırlı)'
+    complexity = 'O((n+m)D), bounded steps'
+
+    def score(self, text1, text2):
+        tokens1, tokens2 = token_stream(text1), token_stream(text2)
+        total = len(tokens1) + len(tokens2)
+        if not tokens1 or not tokens2:
+            return 0.0
+        # Tokens the two do not share are edits the diff must make; reaching
+        # distance D costs at least D^2 / 2 steps, so skip hopeless diffs
+        shared = sum((Counter(tokens1) & Counter(tokens2)).values())
+        minimum = total - 2 * shared
+        max_steps = app.config['DIFF_MAX_STEPS']
+        distance = None
+        if minimum * minimum // 2 <= max_steps:
+            distance = bounded_edit_distance(tokens1.tolist(), tokens2.tolist(), max_steps)
+        if distance is None:
+            return SIMILARITY_ENGINES['winnowing'].score(text1, text2)
+        # 2 * LCS / (n + m)
+        return (total - distance) / total
+
+@register_engine
+class AutoEngine(SimilarityEngine):
+    name = 'auto'
+    label = 'Otomatik'
+    complexity = 'O(n*m) small, O(n+m) large'
+
+    def score(self, text1, text2):
+        if max(len(token_stream(text1)), len(token_stream(text2))) <= app.config['SEQUENCE_MAX_TOKENS']:
+            return SIMILARITY_ENGINES['sequence'].score(text1, text2)
+        return SIMILARITY_ENGINES['winnowing'].score(text1, text2)
+
 # Helper Functions
-def calculate_similarity(text1, text2):
-    return round(SequenceMatcher(None, text1, text2).ratio() * 100, 2)
+@timed('similarity')
+def calculate_similarity(text1, text2, engine=None):
+    return round(get_engine(engine).score(text1, text2) * 100, 2)
+
+@timed('similarity')
+def calculate_similarities(text, others, engine=None):
+    # One text against many; vectorized engines score the batch in one pass
+    return [round(score * 100, 2) for score in get_engine(engine).score_many(text, others)]
+
+def hash_content(data):
+    return hashlib.sha256(data).hexdigest()
+
+# Streaming Extraction
+# Documents are read as a stream of text pieces that concatenate to the full
+# text: decoded chunks for .txt, paragraphs for .docx (parsed straight from
+# the zip with iterparse instead of building a python-docx tree). Callers
+# can feed each piece to fingerprint builders as it arrives.
+W_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+def read_chunks(stream, hasher=None):
+    for chunk in iter(lambda: stream.read(app.config['READ_CHUNK_SIZE']), b''):
+        if hasher is not None:
+            hasher.update(chunk)
+        yield chunk
+
+def iter_txt_text(stream, hasher=None):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = read_chunks(stream, hasher)
+    try:
+        for chunk in chunks:
+            yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+    finally:
+        # The hash covers the whole file even when decoding stops early
+        for _ in chunks:
+            pass
+
+def docx_paragraph_text(paragraph):
+    parts = []
+    for run in paragraph.iter(W_NAMESPACE + 'r'):
+        for node in run:
+            if node.tag == W_NAMESPACE + 't':
+                parts.append(node.text or '')
+            elif node.tag == W_NAMESPACE + 'tab':
+                parts.append('\t')
+            elif node.tag in (W_NAMESPACE + 'br', W_NAMESPACE + 'cr'):
+                parts.append('\n')
+    return ''.join(parts)
+
+def iter_docx_text(stream, hasher=None):
+    # The zip directory sits at the end of a .docx, so the stream is hashed
+    # through first, then rewound; streams that cannot seek are spooled
+    if stream.seekable():
+        for _ in read_chunks(stream, hasher):
+            pass
+        stream.seek(0)
+        source = stream
+    else:
+        source = tempfile.SpooledTemporaryFile(max_size=app.config['EXTRACT_SPOOL_SIZE'])
+        for chunk in read_chunks(stream, hasher):
+            source.write(chunk)
+        source.seek(0)
+    
+    try:
+        with zipfile.ZipFile(source) as archive, archive.open('word/document.xml') as xml:
+            separator = ''
+            fallback_depth = 0  # mc:Fallback repeats text boxes already read
+            for event, element in ElementTree.iterparse(xml, events=('start', 'end')):
+                if element.tag == MC_FALLBACK:
+                    fallback_depth += 1 if event == 'start' else -1
+                elif event == 'end' and element.tag == W_NAMESPACE + 'p':
+                    text = docx_paragraph_text(element) if not fallback_depth else ''
+                    element.clear()
+                    if text:
+                        yield separator + text
+                        separator = '\n'
+    finally:
+        if source is not stream:
+            source.close()
+
+def iter_document_text(stream, filename, hasher=None):
+    if filename.endswith('.txt'):
+        yield from iter_txt_text(stream, hasher)
+    elif filename.endswith('.docx'):
+        yield from iter_docx_text(stream, hasher)
+    else:
+        for _ in read_chunks(stream, hasher):
+            pass
+
+@timed('extraction')
+def extract_text_from_stream(stream, filename, builders=()):
+    # Hash and extract in one pass over an open binary stream (e.g. an
+    # upload's FileStorage.stream); nothing is written to disk unless an
+    # unseekable .docx is larger than EXTRACT_SPOOL_SIZE
+    hasher = hashlib.sha256()
+    parts = []
+    try:
+        for piece in iter_document_text(stream, filename, hasher):
+            parts.append(piece)
+            for builder in builders:
+                builder.update(piece)
+        text = ''.join(parts)
+    except Exception as e:
+        app.logger.error(f"Error extracting text from {filename}: {e}")
+        text = ""
+        for builder in builders:
+            builder.reset()
+    return text, hasher.hexdigest()
+
+def extract_text_from_bytes(data, filename):
+    return extract_text_from_stream(io.BytesIO(data), filename)[0]
 
 def extract_text_from_file(file_path):
     if not file_path or not os.path.exists(file_path):
         return ""
     
-    try:
-        if file_path.endswith('.txt'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        elif file_path.endswith('.docx'):
-            from docx import Document
-            doc = Document(file_path)
-            return '\n'.join([para.text for para in doc.paragraphs if para.text])
-    except Exception as e:
-        app.logger.error(f"Error extracting text from {file_path}: {e}")
+    with open(file_path, 'rb') as f:
+        return extract_text_from_stream(f, file_path)[0]
+
+# Text Store
+# Every file is parsed once; later reads go through the LRU, then SQLite.
+def get_indexed_text(content_hash):
+    text = text_cache.get(content_hash)
+    if text is None:
+        row = get_db().execute(
+            'SELECT text FROM document_texts WHERE content_hash = ?', (content_hash,)
+        ).fetchone()
+        if row:
+            text = row['text']
+            text_cache.set(content_hash, text)
+    return text
+
+def store_text(content_hash, text):
+    db = get_db()
+    db.execute(
+        'INSERT OR IGNORE INTO document_texts (content_hash, text) VALUES (?, ?)',
+        (content_hash, text)
+    )
+    db.commit()
+    text_cache.set(content_hash, text)
+
+def index_file(file_path, builders=()):
+    # Builders (MinHash, winnowing) are fed the pieces as the file is
+    # extracted; a text indexed before is fed to them from the store
+    if not file_path or not os.path.exists(file_path):
+        return None
+    
+    with open(file_path, 'rb') as f:
+        hasher = hashlib.sha256()
+        for _ in read_chunks(f, hasher):
+            pass
+        content_hash = hasher.hexdigest()
+        text = get_indexed_text(content_hash)
+        if text is None:
+            f.seek(0)
+            store_text(content_hash, extract_text_from_stream(f, file_path, builders)[0] or "")
+        else:
+            for builder in builders:
+                builder.update(text)
+    return content_hash
+
+def get_submission_text(submission):
+    content_hash = submission['content_hash']
+    if not content_hash:
+        # Rows from before the text store get indexed on first use
+        content_hash = index_file(submission['file_path'])
+        if not content_hash:
+            return ""
+        db = get_db()
+        db.execute(
+            'UPDATE submissions SET content_hash = ? WHERE id = ?',
+            (content_hash, submission['id'])
+        )
+        db.commit()
+    return get_indexed_text(content_hash) or ""
+
+# Texts missing from memory are fetched concurrently: file reads, SQLite
+# lookups and extraction overlap instead of running one after another.
+# Each worker runs in its own app context, so it gets its own connection.
+extraction_executor = ThreadPoolExecutor(
+    max_workers=app.config['EXTRACTION_WORKERS'], thread_name_prefix='extract'
+)
+
+def _submission_text_in_context(submission):
+    with app.app_context():
+        return get_submission_text(submission)
+
+def get_submission_texts(submissions):
+    texts = [
+        text_cache.get(submission['content_hash']) if submission['content_hash'] else None
+        for submission in submissions
+    ]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if len(missing) == 1:
+        texts[missing[0]] = get_submission_text(submissions[missing[0]])
+    elif missing:
+        fetched = extraction_executor.map(_submission_text_in_context, [submissions[i] for i in missing])
+        for i, text in zip(missing, fetched):
+            texts[i] = text
+    return texts
+
+# Text Blobs
+# Content-addressed, zlib-compressed texts referenced from comparisons. The
+# same text compared many times is stored once and only read when opened.
+def put_blob(db, text):
+    data = text.encode('utf-8')
+    content_hash = hash_content(data)
+    db.execute(
+        'INSERT OR IGNORE INTO text_blobs (content_hash, data, size) VALUES (?, ?, ?)',
+        (content_hash, zlib.compress(data, app.config['BLOB_COMPRESSION_LEVEL']), len(data))
+    )
+    return content_hash
+
+def get_blob(content_hash):
+    if not content_hash:
         return ""
+    text = blob_cache.get(content_hash)
+    if text is None:
+        row = get_db().execute(
+            'SELECT data FROM text_blobs WHERE content_hash = ?', (content_hash,)
+        ).fetchone()
+        if row is None:
+            # A missing text is an error, not an empty one; it is never cached
+            raise LookupError(f"Metin bulunamadı: {content_hash}")
+        text = zlib.decompress(row['data']).decode('utf-8')
+        blob_cache.set(content_hash, text)
+    return text
+
+def record_comparison(user_id, text1, text2, score):
+    db = get_db()
+    cursor = db.execute(
+        'INSERT INTO comparisons (user_id, text1_hash, text2_hash, score) VALUES (?, ?, ?, ?)',
+        (user_id, put_blob(db, text1), put_blob(db, text2), score)
+    )
+    db.commit()
+    return cursor.lastrowid
+
+def delete_orphan_blobs(db):
+    # Texts of queued or running comparisons are still needed by their job
+    db.execute('''
+        DELETE FROM text_blobs WHERE content_hash NOT IN (
+            SELECT text1_hash FROM comparisons WHERE text1_hash IS NOT NULL
+            UNION
+            SELECT text2_hash FROM comparisons WHERE text2_hash IS NOT NULL
+            UNION
+            SELECT json_each.value FROM jobs, json_each(jobs.payload)
+            WHERE jobs.kind = 'compare_texts' AND jobs.status IN ('queued', 'running')
+              AND json_each.key IN ('text1_hash', 'text2_hash')
+        )
+    ''')
+
+# Fingerprint Index
+# Word shingles -> MinHash signature -> LSH bands. Documents that share a band
+# bucket become candidates; only those get an exact similarity score.
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_MINHASH_BATCH = 4096  # shingle hashes buffered between folds
+_minhash_rng = random.Random(1)  # fixed seed: signatures are persisted
+MINHASH_PARAMS = [
+    (_minhash_rng.randint(1, _MERSENNE_PRIME - 1), _minhash_rng.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(app.config['MINHASH_PERMUTATIONS'])
+]
+
+def hash_shingle(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+
+class MinHashBuilder:
+    # MinHash over a text fed in pieces of any size. Shingle hashes are
+    # folded into the running minima every _MINHASH_BATCH shingles, so the
+    # shingles of a large document are never held at once.
+    def __init__(self, size=None):
+        self.size = size or app.config['SHINGLE_SIZE']
+        self.reset()
+
+    def reset(self):
+        self.carry = ''  # a word cut off at the end of the last piece
+        self.words = deque(maxlen=self.size)
+        self.word_count = 0
+        self.pending = set()
+        self.minima = None
+
+    def update(self, piece):
+        words = (self.carry + piece).split()
+        self.carry = words.pop() if words and not piece[-1:].isspace() else ''
+        for word in words:
+            self._add_word(word)
+
+    def _add_word(self, word):
+        self.words.append(word.lower())
+        self.word_count += 1
+        if len(self.words) == self.size:
+            self.pending.add(hash_shingle(' '.join(self.words)))
+            if len(self.pending) >= _MINHASH_BATCH:
+                self._fold()
+
+    def _fold(self):
+        if not self.pending:
+            return
+        minima = [min((a * h + b) % _MERSENNE_PRIME for h in self.pending) for a, b in MINHASH_PARAMS]
+        self.minima = minima if self.minima is None else list(map(min, self.minima, minima))
+        self.pending = set()
+
+    def signature(self):
+        if self.carry:
+            self._add_word(self.carry)
+            self.carry = ''
+        if 0 < self.word_count < self.size:
+            # Texts shorter than one shingle are a single shingle
+            self.pending.add(hash_shingle(' '.join(self.words)))
+        self._fold()
+        if self.minima is None:
+            return array('I', [_MAX_HASH] * len(MINHASH_PARAMS))
+        return array('I', (value & _MAX_HASH for value in self.minima))
+
+def minhash_signature(text):
+    builder = MinHashBuilder()
+    builder.update(text)
+    return builder.signature()
+
+def lsh_band_keys(signature):
+    rows = len(signature) // app.config['LSH_BANDS']
+    keys = []
+    for band in range(app.config['LSH_BANDS']):
+        chunk = signature[band * rows:(band + 1) * rows].tobytes()
+        digest = hashlib.blake2b(chunk, digest_size=8).digest()
+        keys.append((band, int.from_bytes(digest, 'little', signed=True)))
+    return keys
+
+def estimate_jaccard(signature1, signature2):
+    matches = sum(1 for a, b in zip(signature1, signature2) if a == b)
+    return matches / len(signature1)
+
+def load_signature(blob):
+    signature = array('I')
+    signature.frombytes(blob)
+    return signature
+
+def index_submission_fingerprint(submission_id, assignment_id, signature):
+    db = get_db()
+    db.execute(
+        'INSERT OR REPLACE INTO submission_signatures (submission_id, assignment_id, signature) VALUES (?, ?, ?)',
+        (submission_id, assignment_id, signature.tobytes())
+    )
+    db.executemany(
+        'INSERT OR IGNORE INTO lsh_buckets (assignment_id, band, bucket, submission_id) VALUES (?, ?, ?, ?)',
+        [(assignment_id, band, bucket, submission_id) for band, bucket in lsh_band_keys(signature)]
+    )
+    db.commit()
+    return signature
+
+def backfill_fingerprints(assignment_id):
+    # Submissions stored before the index existed are fingerprinted once
+    missing = get_db().execute('''
+        SELECT s.id, s.assignment_id, s.file_path, s.content_hash
+        FROM submissions s
+        LEFT JOIN submission_signatures g ON g.submission_id = s.id
+        WHERE s.assignment_id = ? AND g.submission_id IS NULL
+    ''', (assignment_id,)).fetchall()
+    for sub in missing:
+        index_submission_fingerprint(sub['id'], sub['assignment_id'], minhash_signature(get_submission_text(sub)))
+
+def find_candidates(submission, limit=None):
+    return lsh_candidates(submission)[:limit or app.config['CANDIDATE_LIMIT']]
+
+def lsh_candidates(submission):
+    backfill_fingerprints(submission['assignment_id'])
+    
+    db = get_db()
+    signature = load_signature(db.execute(
+        'SELECT signature FROM submission_signatures WHERE submission_id = ?',
+        (submission['id'],)
+    ).fetchone()['signature'])
+    
+    # Any shared band bucket makes a candidate
+    keys = lsh_band_keys(signature)
+    placeholders = ', '.join(['(?, ?)'] * len(keys))
+    params = [submission['assignment_id'], submission['id']]
+    for band, bucket in keys:
+        params.extend([band, bucket])
+    rows = db.execute(f'''
+        SELECT DISTINCT g.submission_id, g.signature
+        FROM lsh_buckets b
+        JOIN submission_signatures g ON g.submission_id = b.submission_id
+        WHERE b.assignment_id = ? AND b.submission_id != ?
+          AND (b.band, b.bucket) IN (VALUES {placeholders})
+    ''', params).fetchall()
+    
+    # Rank by estimated Jaccard and keep the top K
+    candidates = [
+        (row['submission_id'], estimate_jaccard(signature, load_signature(row['signature'])))
+        for row in rows
+    ]
+    candidates.sort(key=lambda x: x[1], reverse=True)
+    return candidates
+
+# Vector Kernel
+# Documents become token-shingle frequency vectors: sorted uint32 term ids
+# with L2-normalized float32 weights. One-vs-many looks every document's ids
+# up in the query with one searchsorted; many-vs-many accumulates documents
+# sharing a term with bincount. Neither loops over pairs in Python.
+vector_cache = LRUCache(app.config['VECTOR_CACHE_SIZE'])
+
+def term_vector(text):
+    key = text_hash(text)
+    vector = vector_cache.get(key)
+    if vector is None:
+        hashes = np.frombuffer(token_shingles(token_stream(text, key)), dtype=np.uint32)
+        indices, counts = np.unique(hashes.astype(np.uint64) % app.config['VECTOR_DIMENSIONS'], return_counts=True)
+        weights = counts.astype(np.float32)
+        norm = np.linalg.norm(weights)
+        if norm:
+            weights /= norm
+        vector = (indices.astype(np.uint32), weights)
+        vector_cache.set(key, vector)
+    return vector
+
+def cosine_fallback(text1, text2):
+    counts1 = Counter(token_shingles(token_stream(text1)))
+    counts2 = Counter(token_shingles(token_stream(text2)))
+    if not counts1 or not counts2:
+        return 0.0
+    dot = sum(count * counts2[shingle] for shingle, count in counts1.items())
+    norm1 = sum(count * count for count in counts1.values()) ** 0.5
+    norm2 = sum(count * count for count in counts2.values()) ** 0.5
+    return min(dot / (norm1 * norm2), 1.0)
+
+def segment_sums(values, lengths):
+    # np.add.reduceat mishandles empty segments; difference a cumulative sum
+    totals = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    ends = np.cumsum(lengths)
+    return totals[ends] - totals[ends - lengths]
+
+def one_vs_many(vector, vectors, metric):
+    if not vectors:
+        return np.zeros(0)
+    query_indices, query_weights = vector
+    lengths = np.array([len(indices) for indices, _ in vectors])
+    all_indices = np.concatenate([indices for indices, _ in vectors])
+    
+    # Look up each document's terms in the query with a binary search
+    positions = np.searchsorted(query_indices, all_indices)
+    positions[positions == len(query_indices)] = 0
+    hits = query_indices[positions] == all_indices if len(query_indices) else np.zeros(len(all_indices), bool)
+    
+    if metric == 'cosine':
+        all_weights = np.concatenate([weights for _, weights in vectors])
+        products = np.where(hits, query_weights[positions] * all_weights if len(query_indices) else 0, 0)
+        return np.clip(segment_sums(products, lengths), 0.0, 1.0)
+    
+    shared = segment_sums(hits.astype(np.float64), lengths)
+    smaller = np.minimum(lengths, len(query_indices))
+    return np.divide(shared, smaller, out=np.zeros(len(vectors)), where=smaller > 0)
+
+def many_vs_many(vectors, metric):
+    n = len(vectors)
+    lengths = np.array([len(indices) for indices, _ in vectors], dtype=np.int64)
+    if n == 0 or not lengths.sum():
+        return np.zeros((n, n))
+    terms = np.concatenate([indices for indices, _ in vectors])
+    docs = np.repeat(np.arange(n), lengths)
+    if metric == 'cosine':
+        weights = np.concatenate([weights for _, weights in vectors]).astype(np.float64)
+    else:
+        weights = np.ones(len(terms))
+    
+    # Group entries by term; a stable sort keeps doc ids ascending in a group
+    order = np.argsort(terms, kind='stable')
+    terms, docs, weights = terms[order], docs[order], weights[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(terms)) + 1))
+    sizes = np.diff(np.concatenate((starts, [len(terms)])))
+    
+    # Every pair of documents sharing a rarer term, handled one group size
+    # at a time, at most VECTOR_STEP_SIZE pairs per step
+    step_size = app.config['VECTOR_STEP_SIZE']
+    dense = sizes > app.config['VECTOR_DENSE_DF']
+    products = np.zeros(n * n)
+    for size in np.unique(sizes[(sizes > 1) & ~dense]):
+        group_starts = starts[sizes == size]
+        left, right = np.triu_indices(size, k=1)
+        step = max(1, step_size // len(left))
+        for block in range(0, len(group_starts), step):
+            positions = group_starts[block:block + step, None] + np.arange(size)
+            first, second = positions[:, left].ravel(), positions[:, right].ravel()
+            products += np.bincount(docs[first] * n + docs[second],
+                                    weights=weights[first] * weights[second], minlength=n * n)
+    matrix = products.reshape(n, n)
+    matrix = matrix + matrix.T
+    
+    # Terms most documents share (a pasted prompt) would make pair lists
+    # quadratic in their document count; they go through a dense
+    # document x term block instead, a few columns at a time
+    dense_starts, dense_sizes = starts[dense], sizes[dense]
+    columns = max(1, step_size // n)
+    for block in range(0, len(dense_starts), columns):
+        block_starts, block_sizes = dense_starts[block:block + columns], dense_sizes[block:block + columns]
+        offsets = np.arange(block_sizes.sum()) - np.repeat(np.cumsum(block_sizes) - block_sizes, block_sizes)
+        entries = np.repeat(block_starts, block_sizes) + offsets
+        terms_block = np.zeros((n, len(block_starts)))
+        terms_block[docs[entries], np.repeat(np.arange(len(block_starts)), block_sizes)] = weights[entries]
+        matrix += terms_block @ terms_block.T
+    
+    if metric == 'containment':
+        smaller = np.minimum.outer(lengths, lengths)
+        matrix = np.divide(matrix, smaller, out=np.zeros((n, n)), where=smaller > 0)
+    np.fill_diagonal(matrix, 1.0)
+    return np.clip(matrix, 0.0, 1.0)
+
+# Corpus Index
+# Every submission's winnowing fingerprints are posted to one inverted index,
+# so any text can be matched against all terms and assignments at once.
+def corpus_fingerprint_builder():
+    return WinnowBuilder(app.config['CORPUS_WINNOW_K'], app.config['CORPUS_WINNOW_WINDOW'])
+
+def corpus_fingerprints(text):
+    builder = corpus_fingerprint_builder()
+    builder.update(text)
+    return builder.fingerprints()
+
+def index_corpus_fingerprints(submission_id, fingerprints):
+    db = get_db()
+    db.executemany(
+        'INSERT OR IGNORE INTO fingerprint_postings (fingerprint, submission_id) VALUES (?, ?)',
+        [(fingerprint, submission_id) for fingerprint in fingerprints]
+    )
+    db.execute(
+        'INSERT OR REPLACE INTO fingerprint_documents (submission_id, fingerprint_count) VALUES (?, ?)',
+        (submission_id, len(fingerprints))
+    )
+    db.commit()
+    return len(fingerprints)
+
+def search_corpus(text, exclude_id=None, limit=None):
+    fingerprints = corpus_fingerprints(text)
+    if not fingerprints:
+        return []
+    
+    rows = get_db().execute('''
+        SELECT p.submission_id, COUNT(*) AS shared, d.fingerprint_count,
+               s.submitted_at, s.student_id, a.name AS assignment_name
+        FROM fingerprint_postings p
+        JOIN fingerprint_documents d ON d.submission_id = p.submission_id
+        JOIN submissions s ON s.id = p.submission_id
+        JOIN assignments a ON s.assignment_id = a.id
+        WHERE p.fingerprint IN (SELECT value FROM json_each(?))
+          AND p.submission_id != ?
+        GROUP BY p.submission_id
+        ORDER BY shared DESC
+        LIMIT ?
+    ''', (json.dumps(list(fingerprints)), exclude_id or 0,
+          limit or app.config['CORPUS_SEARCH_LIMIT'])).fetchall()
+    rows = attach_usernames(rows, student_name='student_id')
+    
+    return [{
+        'id': row['submission_id'],
+        'student_name': row['student_name'],
+        'assignment_name': row['assignment_name'],
+        'submitted_at': row['submitted_at'],
+        'shared': row['shared'],
+        # Share of the query found in the match, and of the match found in the query
+        'coverage': round(row['shared'] / len(fingerprints) * 100, 2),
+        'containment': round(row['shared'] / max(row['fingerprint_count'], 1) * 100, 2),
+    } for row in rows]
+
+def backfill_corpus_index():
+    missing = get_db().execute('''
+        SELECT s.id, s.file_path, s.content_hash
+        FROM submissions s
+        LEFT JOIN fingerprint_documents d ON d.submission_id = s.id
+        WHERE d.submission_id IS NULL
+    ''').fetchall()
+    for sub in missing:
+        index_corpus_fingerprints(sub['id'], corpus_fingerprints(get_submission_text(sub)))
+    return len(missing)
+
+@app.cli.command('index-corpus')
+def index_corpus_command():
+    """Add submissions missing from the corpus-wide fingerprint index."""
+    click.echo(f'{backfill_corpus_index()} gönderim dizine eklendi')
+
+# Passage Alignment
+# Seed-and-extend: shared word k-grams are seeds, each seed is grown left and
+# right into a maximal run of equal words. Seeds already inside a span on the
+# same diagonal are skipped, which keeps the whole pass near-linear.
+WORD_PATTERN = re.compile(r'\w+')
+
+def word_offsets(text):
+    return [(m.start(), m.end(), m.group().lower()) for m in WORD_PATTERN.finditer(text)]
+
+def align_passages(text1, text2):
+    words1, words2 = word_offsets(text1), word_offsets(text2)
+    tokens1 = [word for _, _, word in words1]
+    tokens2 = [word for _, _, word in words2]
+    k = app.config['ALIGN_SEED_WORDS']
+    
+    seeds = {}
+    for j in range(len(tokens2) - k + 1):
+        seeds.setdefault(tuple(tokens2[j:j + k]), []).append(j)
+    
+    spans = []
+    covered = {}  # diagonal (j - i) -> end of the last span on it, in text1 words
+    for i in range(len(tokens1) - k + 1):
+        hits = seeds.get(tuple(tokens1[i:i + k]))
+        if not hits or len(hits) > app.config['ALIGN_MAX_SEED_HITS']:
+            continue
+        for j in hits:
+            diagonal = j - i
+            if covered.get(diagonal, -1) > i:
+                continue
+            start1, start2 = i, j
+            while start1 > 0 and start2 > 0 and tokens1[start1 - 1] == tokens2[start2 - 1]:
+                start1 -= 1
+                start2 -= 1
+            end1, end2 = i + k, j + k
+            while end1 < len(tokens1) and end2 < len(tokens2) and tokens1[end1] == tokens2[end2]:
+                end1 += 1
+                end2 += 1
+            covered[diagonal] = end1
+            if end1 - start1 >= app.config['ALIGN_MIN_WORDS']:
+                spans.append((start1, end1, start2, end2))
+    
+    # Longest passages first; drop any that overlap one already kept
+    spans.sort(key=lambda span: span[1] - span[0], reverse=True)
+    kept = []
+    used1, used2 = set(), set()
+    for start1, end1, start2, end2 in spans:
+        if used1.intersection(range(start1, end1)) or used2.intersection(range(start2, end2)):
+            continue
+        used1.update(range(start1, end1))
+        used2.update(range(start2, end2))
+        kept.append((start1, end1, start2, end2))
+    kept.sort()
+    
+    # Word indexes -> character offsets for highlighting
+    return [
+        [words1[start1][0], words1[end1 - 1][1], words2[start2][0], words2[end2 - 1][1]]
+        for start1, end1, start2, end2 in kept
+    ]
+
+def get_passage_alignment(submission1, submission2):
+    # Cached per unordered pair; reopening the view skips the alignment
+    swapped = submission1['id'] > submission2['id']
+    low, high = (submission2, submission1) if swapped else (submission1, submission2)
+    
+    db = get_db()
+    row = db.execute(
+        'SELECT spans FROM passage_alignments WHERE submission1_id = ? AND submission2_id = ?',
+        (low['id'], high['id'])
+    ).fetchone()
+    if row:
+        spans = json.loads(row['spans'])
+    else:
+        spans = align_passages(get_submission_text(low), get_submission_text(high))
+        db.execute(
+            'INSERT OR REPLACE INTO passage_alignments (submission1_id, submission2_id, spans) VALUES (?, ?, ?)',
+            (low['id'], high['id'], json.dumps(spans))
+        )
+        db.commit()
+    
+    if swapped:
+        spans = [[start2, end2, start1, end1] for start1, end1, start2, end2 in spans]
+    return spans
+
+def highlight_segments(text, ranges):
+    # Split text into (segment, passage number or None) for the template
+    segments = []
+    position = 0
+    for number, (start, end) in sorted(enumerate(ranges, start=1), key=lambda item: item[1][0]):
+        if start > position:
+            segments.append((text[position:start], None))
+        segments.append((text[start:end], number))
+        position = end
+    if position < len(text):
+        segments.append((text[position:], None))
+    return segments
+
+# Assignment Analysis
+# The similarity matrix of an assignment is computed once and stored. Pairs
+# that share no LSH bucket are pruned and never scored.
+_worker_engine = None
+_worker_texts = {}
+
+def _init_scoring_worker(config, engine, texts, streams):
+    global _worker_engine, _worker_texts
+    app.config.update(config)
+    _worker_engine = engine
+    _worker_texts = texts
+    # Token streams come from the parent; workers never tokenize
+    token_cache.maxsize = max(token_cache.maxsize, len(streams))
+    for content_hash, tokens in streams.items():
+        token_cache.set(content_hash, tokens)
+
+def _score_pair(pair):
+    id1, id2 = pair
+    return id1, id2, calculate_similarity(_worker_texts[id1], _worker_texts[id2], _worker_engine)
+
+def score_pairs(engine, texts, pairs, streams, progress=None):
+    if len(pairs) < app.config['ANALYSIS_POOL_MIN_PAIRS']:
+        return [(id1, id2, calculate_similarity(texts[id1], texts[id2], engine)) for id1, id2 in pairs]
+    
+    workers = app.config['ANALYSIS_WORKERS'] or os.cpu_count() or 1
+    chunksize = max(1, len(pairs) // (workers * 4))
+    scores = []
+    # Workers start from a fresh interpreter, not a fork: this runs on job
+    # threads, and a fork would copy locks other threads hold at that moment
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('forkserver'),
+                             initializer=_init_scoring_worker,
+                             initargs=(dict(app.config), engine, texts, streams)) as executor:
+        for result in executor.map(_score_pair, pairs, chunksize=chunksize):
+            scores.append(result)
+            if progress and len(scores) % chunksize == 0:
+                progress(len(scores) / len(pairs))
+    return scores
+
+def vectorized_engine(engine):
+    return np is not None and type(get_engine(engine)).score_matrix is not SimilarityEngine.score_matrix
+
+def candidate_pairs(assignment_id):
+    rows = get_db().execute('''
+        SELECT DISTINCT b1.submission_id AS id1, b2.submission_id AS id2
+        FROM lsh_buckets b1
+        JOIN lsh_buckets b2
+          ON b2.assignment_id = b1.assignment_id AND b2.band = b1.band
+         AND b2.bucket = b1.bucket AND b2.submission_id > b1.submission_id
+        WHERE b1.assignment_id = ?
+    ''', (assignment_id,)).fetchall()
+    return [(row['id1'], row['id2']) for row in rows]
+
+def analyze_assignment(assignment_id, progress=None):
+    db = get_db()
+    assignment = db.execute(
+        'SELECT id, similarity_engine FROM assignments WHERE id = ?', (assignment_id,)
+    ).fetchone()
+    if not assignment:
+        return 0
+    
+    started_at = db.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0]
+    backfill_fingerprints(assignment_id)
+    submissions = db.execute(
+        'SELECT id, file_path, content_hash FROM submissions WHERE assignment_id = ? ORDER BY id',
+        (assignment_id,)
+    ).fetchall()
+    texts = dict(zip([sub['id'] for sub in submissions], get_submission_texts(submissions)))
+    streams = prepare_token_streams(db, texts.values())
+    engine = assignment['similarity_engine'] or app.config['SIMILARITY_ENGINE']
+    
+    # Pairs are chosen as score_submission chooses peers: every pair for a
+    # vectorized engine, the containment bound with numpy, LSH buckets without
+    if vectorized_engine(engine):
+        # Vectorized engines score the whole matrix in one pass
+        ids = list(texts)
+        matrix = get_engine(engine).score_matrix([texts[i] for i in ids])
+        scores = [
+            (ids[i], ids[j], round(matrix[i][j] * 100, 2))
+            for i in range(len(ids)) for j in range(i + 1, len(ids))
+        ]
+        scores = [(id1, id2, score) for id1, id2, score in scores if score > 0]
+    else:
+        if np is not None:
+            # Exact shingle containment for every pair as the pruning bound
+            ids = list(texts)
+            bound = many_vs_many([term_vector(texts[i]) for i in ids], 'containment')
+            rows, columns = np.nonzero(np.triu(bound >= app.config['ANALYSIS_MIN_CONTAINMENT'], k=1))
+            pairs = [(ids[i], ids[j]) for i, j in zip(rows.tolist(), columns.tolist())]
+        else:
+            pairs = [pair for pair in candidate_pairs(assignment_id) if pair[0] in texts and pair[1] in texts]
+        if progress:
+            progress(0.1)
+        scores = score_pairs(
+            engine, texts, pairs, streams,
+            progress=progress and (lambda done: progress(0.1 + 0.8 * done))
+        )
+    
+    # Only pairs among the submissions read above are replaced; a submission
+    # added meanwhile keeps the scores score_submission gave it
+    ids = json.dumps(list(texts))
+    db.execute('''
+        DELETE FROM similarity_scores
+        WHERE assignment_id = ?
+          AND submission1_id IN (SELECT value FROM json_each(?))
+          AND submission2_id IN (SELECT value FROM json_each(?))
+    ''', (assignment_id, ids, ids))
+    db.executemany(
+        '''INSERT INTO similarity_scores
+           (assignment_id, submission1_id, submission2_id, score, engine)
+           VALUES (?, ?, ?, ?, ?)''',
+        [(assignment_id, id1, id2, score, engine) for id1, id2, score in scores]
+    )
+    db.execute('UPDATE assignments SET analyzed_at = ? WHERE id = ?', (started_at, assignment_id))
+    db.executemany(
+        'UPDATE submissions SET scored_at = ? WHERE id = ?',
+        [(started_at, submission_id) for submission_id in texts]
+    )
+    refresh_neighbors(db, texts)
+    db.commit()
+    query_cache.invalidate('scores')
+    return len(scores)
+
+def upsert_scores(db, assignment_id, engine, scores):
+    db.executemany(
+        '''INSERT INTO similarity_scores
+           (assignment_id, submission1_id, submission2_id, score, engine)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (submission1_id, submission2_id) DO UPDATE SET
+               score = excluded.score, engine = excluded.engine,
+               computed_at = CURRENT_TIMESTAMP''',
+        [(assignment_id, min(id1, id2), max(id1, id2), score, engine) for id1, id2, score in scores]
+    )
+
+def refresh_neighbors(db, submission_ids):
+    # Rebuild the top-K lists of just these submissions from their rows in
+    # similarity_scores; both lookups are index range scans
+    ids = json.dumps(list(submission_ids))
+    db.execute(
+        'DELETE FROM submission_neighbors WHERE submission_id IN (SELECT value FROM json_each(?))',
+        (ids,)
+    )
+    db.execute('''
+        INSERT INTO submission_neighbors (submission_id, neighbor_id, assignment_id, score)
+        SELECT submission_id, neighbor_id, assignment_id, score FROM (
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY submission_id ORDER BY score DESC, neighbor_id
+            ) AS rank
+            FROM (
+                SELECT submission1_id AS submission_id, submission2_id AS neighbor_id, assignment_id, score
+                FROM similarity_scores
+                WHERE submission1_id IN (SELECT value FROM json_each(?))
+                UNION ALL
+                SELECT submission2_id, submission1_id, assignment_id, score
+                FROM similarity_scores
+                WHERE submission2_id IN (SELECT value FROM json_each(?))
+            )
+        )
+        WHERE rank <= ?
+    ''', (ids, ids, app.config['NEIGHBOR_COUNT']))
+
+def score_submission(submission_id):
+    # Incremental update: only the new submission is scored, against the
+    # peers analyze_assignment would pair it with, so both leave the same rows
+    db = get_db()
+    submission = db.execute('''
+        SELECT s.id, s.assignment_id, s.file_path, s.content_hash, a.similarity_engine
+        FROM submissions s
+        JOIN assignments a ON s.assignment_id = a.id
+        WHERE s.id = ?
+    ''', (submission_id,)).fetchone()
+    if not submission:
+        return 0
+    
+    engine = submission['similarity_engine'] or app.config['SIMILARITY_ENGINE']
+    if np is None:
+        candidate_ids = [candidate_id for candidate_id, _ in lsh_candidates(submission)]
+        placeholders = ', '.join('?' * len(candidate_ids))
+        peers = db.execute(
+            f'SELECT id, file_path, content_hash FROM submissions WHERE id IN ({placeholders})',
+            candidate_ids
+        ).fetchall()
+    else:
+        peers = db.execute(
+            'SELECT id, file_path, content_hash FROM submissions WHERE assignment_id = ? AND id != ?',
+            (submission['assignment_id'], submission_id)
+        ).fetchall()
+    text, *peer_texts = get_submission_texts([submission] + peers)
+    prepare_token_streams(db, [text] + peer_texts)
+    
+    if vectorized_engine(engine):
+        similarities = calculate_similarities(text, peer_texts, engine)
+        scores = [(submission_id, peer['id'], score) for peer, score in zip(peers, similarities) if score > 0]
+    else:
+        if np is not None:
+            # The containment bound analyze_assignment prunes pairs with
+            bound = one_vs_many(term_vector(text), [term_vector(peer_text) for peer_text in peer_texts], 'containment')
+            kept = np.flatnonzero(bound >= app.config['ANALYSIS_MIN_CONTAINMENT']).tolist()
+            peers, peer_texts = [peers[i] for i in kept], [peer_texts[i] for i in kept]
+        # Lower id first, as analyze_assignment scores a pair; difflib's
+        # ratio depends on which text comes first
+        scores = [
+            (submission_id, peer['id'],
+             calculate_similarity(peer_text, text, engine) if peer['id'] < submission_id
+             else calculate_similarity(text, peer_text, engine))
+            for peer, peer_text in zip(peers, peer_texts)
+        ]
+    
+    # A re-scored submission drops pairs that no longer pass
+    previous = [row['peer_id'] for row in db.execute('''
+        SELECT submission2_id AS peer_id FROM similarity_scores WHERE submission1_id = ?
+        UNION ALL
+        SELECT submission1_id FROM similarity_scores WHERE submission2_id = ?
+    ''', (submission_id, submission_id)).fetchall()]
+    db.execute(
+        'DELETE FROM similarity_scores WHERE submission1_id = ? OR submission2_id = ?',
+        (submission_id, submission_id)
+    )
+    upsert_scores(db, submission['assignment_id'], engine, scores)
+    # The submission's list, and those of the peers it entered or left
+    refresh_neighbors(db, {submission_id, *previous, *(peer['id'] for peer in peers)})
+    db.execute('UPDATE submissions SET scored_at = CURRENT_TIMESTAMP WHERE id = ?', (submission_id,))
+    db.commit()
+    query_cache.invalidate('scores')
+    return len(scores)
+
+def get_precomputed_scores(submission_id, limit):
+    rows = get_db().execute('''
+        SELECT neighbor_id, score FROM submission_neighbors
+        WHERE submission_id = ?
+        ORDER BY score DESC, neighbor_id
+        LIMIT ?
+    ''', (submission_id, limit)).fetchall()
+    return [(row['neighbor_id'], row['score']) for row in rows]
+
+def get_risk_pairs(teacher_id, limit):
+    # Every pair in the top RISK_PAIR_LIMIT is in at least one member's
+    # neighbor list as long as RISK_PAIR_LIMIT <= NEIGHBOR_COUNT; a pair
+    # listed both ways is kept once
+    rows = get_db().execute('''
+        SELECT n.submission_id AS submission1_id, n.neighbor_id AS submission2_id, n.score,
+               a.name AS assignment_name, s1.student_id AS student1_id, s2.student_id AS student2_id
+        FROM assignments a
+        JOIN submission_neighbors n ON n.assignment_id = a.id
+        JOIN submissions s1 ON s1.id = n.submission_id
+        JOIN submissions s2 ON s2.id = n.neighbor_id
+        WHERE a.teacher_id = ?
+          AND (n.submission_id < n.neighbor_id OR NOT EXISTS (
+              SELECT 1 FROM submission_neighbors r
+              WHERE r.submission_id = n.neighbor_id AND r.neighbor_id = n.submission_id
+          ))
+        ORDER BY n.score DESC
+        LIMIT ?
+    ''', (teacher_id, limit)).fetchall()
+    return attach_usernames(rows, student1_name='student1_id', student2_name='student2_id')
 
 def save_assignment_file(file):
     if not file or file.filename == '':
@@ -121,11 +2089,559 @@ def save_assignment_file(file):
     file.save(file_path)
     return file_path
 
+# Background Jobs
+# Jobs live in the jobs table and are picked up by a small pool of worker
+# threads in this process. Handlers get the decoded payload and a progress
+# callback; failures are retried up to max_attempts.
+JOB_HANDLERS = {}
+_job_workers = []
+_job_workers_lock = threading.Lock()
+_job_wakeup = threading.Event()
+
+def job_handler(kind):
+    def decorator(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return decorator
+
+def make_job_key(kind, payload):
+    return f"{kind}:{json.dumps(payload, sort_keys=True)}"
+
+def enqueue_job(kind, payload, created_by=None, unique=True):
+    db = get_db()
+    job_key = make_job_key(kind, payload) if unique else None
+    # The same work already waiting or running is not queued twice; the
+    # partial unique index on job_key settles concurrent enqueues
+    cursor = db.execute(
+        '''INSERT INTO jobs (kind, job_key, payload, max_attempts, created_by)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT DO NOTHING''',
+        (kind, job_key, json.dumps(payload), app.config['JOB_MAX_ATTEMPTS'], created_by)
+    )
+    if cursor.rowcount == 0:
+        existing = db.execute(
+            "SELECT id FROM jobs WHERE job_key = ? AND status IN ('queued', 'running')",
+            (job_key,)
+        ).fetchone()
+        db.commit()
+        if existing:
+            return existing['id']
+        # The other job finished in between
+        return enqueue_job(kind, payload, created_by, unique)
+    db.commit()
+    job_id = cursor.lastrowid
+    
+    if app.config['JOBS_INLINE']:
+        run_job(claim_job(job_id))
+    else:
+        start_job_workers()
+        _job_wakeup.set()
+    return job_id
+
+def get_job(job_id):
+    return get_db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+def get_active_job(kind, payload):
+    return get_db().execute(
+        "SELECT * FROM jobs WHERE job_key = ? AND status IN ('queued', 'running') ORDER BY id DESC LIMIT 1",
+        (make_job_key(kind, payload),)
+    ).fetchone()
+
+def set_job_progress(job_id, progress):
+    db = get_db()
+    db.execute(
+        'UPDATE jobs SET progress = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+        (min(max(progress, 0.0), 1.0), job_id)
+    )
+    db.commit()
+
+def claim_job(job_id):
+    db = get_db()
+    cursor = db.execute(
+        '''UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                  updated_at = CURRENT_TIMESTAMP
+           WHERE id = ? AND status = 'queued' ''',
+        (job_id,)
+    )
+    db.commit()
+    return get_job(job_id) if cursor.rowcount == 1 else None
+
+def claim_next_job():
+    db = get_db()
+    # Requeue jobs whose worker died mid-run
+    db.execute(
+        '''UPDATE jobs SET status = 'queued'
+           WHERE status = 'running' AND updated_at < datetime('now', ?)''',
+        (f"-{app.config['JOB_STALE_SECONDS']} seconds",)
+    )
+    db.commit()
+    
+    # Another worker may win the race for a row; try the next one
+    for row in db.execute(
+        "SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 10"
+    ).fetchall():
+        job = claim_job(row['id'])
+        if job:
+            return job
+    return None
+
+@contextmanager
+def job_heartbeat(job_id):
+    # A running job's updated_at is refreshed even when its handler reports
+    # no progress, so only jobs whose worker is gone look stale
+    stop = threading.Event()
+    
+    def beat():
+        while not stop.wait(app.config['JOB_HEARTBEAT_INTERVAL']):
+            try:
+                with app.app_context():
+                    db = get_db()
+                    db.execute(
+                        "UPDATE jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'",
+                        (job_id,)
+                    )
+                    db.commit()
+            except Exception as e:
+                app.logger.error(f"Heartbeat for job {job_id} failed: {e}")
+    
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+def run_job(job):
+    if job is None:
+        return
+    db = get_db()
+    try:
+        handler = JOB_HANDLERS[job['kind']]
+        with job_heartbeat(job['id']):
+            result = handler(json.loads(job['payload']),
+                             lambda progress: set_job_progress(job['id'], progress))
+        db.execute(
+            '''UPDATE jobs SET status = 'done', progress = 1, result = ?, error = NULL,
+                      updated_at = CURRENT_TIMESTAMP
+               WHERE id = ?''',
+            (json.dumps(result), job['id'])
+        )
+    except Exception as e:
+        # Drop whatever the handler wrote before it raised
+        db.rollback()
+        app.logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        status = 'queued' if job['attempts'] < job['max_attempts'] else 'failed'
+        db.execute(
+            'UPDATE jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            (status, str(e), job['id'])
+        )
+    db.commit()
+
+def _job_worker_loop():
+    while True:
+        try:
+            with app.app_context():
+                job = claim_next_job()
+                run_job(job)
+        except Exception as e:
+            app.logger.error(f"Job worker error: {e}")
+            job = None
+        if job is None:
+            _job_wakeup.wait(app.config['JOB_POLL_INTERVAL'])
+            _job_wakeup.clear()
+
+def start_job_workers():
+    if app.config['JOBS_INLINE'] or _job_workers:
+        return
+    with _job_workers_lock:
+        while len(_job_workers) < app.config['JOB_WORKERS']:
+            worker = threading.Thread(target=_job_worker_loop, name=f'job-worker-{len(_job_workers)}', daemon=True)
+            worker.start()
+            _job_workers.append(worker)
+
+@app.before_request
+def ensure_job_workers():
+    start_job_workers()
+
+@job_handler('extract_submission')
+def extract_submission_job(payload, progress):
+    db = get_db()
+    submission = db.execute(
+        'SELECT id, assignment_id, file_path, content_hash FROM submissions WHERE id = ?',
+        (payload['submission_id'],)
+    ).fetchone()
+    if not submission:
+        return None
+    
+    # The fingerprints are built from the pieces as the file is extracted,
+    # not from a second pass over the joined text
+    signature_builder, corpus_builder = MinHashBuilder(), corpus_fingerprint_builder()
+    content_hash = index_file(submission['file_path'], (signature_builder, corpus_builder))
+    if content_hash and content_hash != submission['content_hash']:
+        db.execute('UPDATE submissions SET content_hash = ? WHERE id = ?', (content_hash, submission['id']))
+        db.commit()
+    text = (get_indexed_text(content_hash) if content_hash else None) or ""
+    query_cache.invalidate('submissions')
+    prepare_token_streams(db, [text])
+    progress(0.4)
+    index_submission_fingerprint(submission['id'], submission['assignment_id'], signature_builder.signature())
+    index_corpus_fingerprints(submission['id'], corpus_builder.fingerprints())
+    progress(0.6)
+    pair_count = score_submission(submission['id'])
+    return {'characters': len(text), 'pair_count': pair_count}
+
+@job_handler('score_submission')
+def score_submission_job(payload, progress):
+    return {'pair_count': score_submission(payload['submission_id'])}
+
+@job_handler('extract_assignment')
+def extract_assignment_job(payload, progress):
+    content_hash = index_file(payload['file_path'])
+    db = get_db()
+    db.execute(
+        'UPDATE assignments SET content_hash = ? WHERE id = ?',
+        (content_hash, payload['assignment_id'])
+    )
+    db.commit()
+    query_cache.invalidate('assignments')
+    return {'content_hash': content_hash}
+
+@job_handler('analyze_assignment')
+def analyze_assignment_job(payload, progress):
+    return {'pair_count': analyze_assignment(payload['assignment_id'], progress)}
+
+@job_handler('compare_texts')
+def compare_texts_job(payload, progress):
+    text1, text2 = get_blob(payload['text1_hash']), get_blob(payload['text2_hash'])
+    prepare_token_streams(get_db(), [text1, text2])
+    score = calculate_similarity(text1, text2, payload['engine'])
+    comparison_id = record_comparison(payload['user_id'], text1, text2, score)
+    return {'score': score, 'comparison_id': comparison_id}
+
+# Bulk Import
+# `flask import-submissions` loads a zip or directory of .txt/.docx files.
+# Workers save, extract and fingerprint each file; the parent inserts the
+# results one batch per transaction. A file is named after its student
+# (ali.docx) or sits in the student's folder (ali/odev.docx); files already
+# imported are skipped, so an interrupted run picks up where it stopped.
+# Stored files are named after the whole member path, so two files called
+# odev.docx in different folders never share a name.
+IMPORT_EXTENSIONS = ('.txt', '.docx')
+_import_source = None
+
+def _init_import_worker(config, source):
+    global _import_source
+    app.config.update(config)
+    _import_source = source if os.path.isdir(source) else zipfile.ZipFile(source)
+
+def _extract_import_file(item):
+    member, file_path = item
+    if isinstance(_import_source, zipfile.ZipFile):
+        source = _import_source.open(member)
+    else:
+        source = open(os.path.join(_import_source, member), 'rb')
+    with source, open(file_path, 'wb') as f:
+        shutil.copyfileobj(source, f, app.config['READ_CHUNK_SIZE'])
+    
+    # Fingerprints are built from the pieces as they are extracted
+    signature_builder, corpus_builder = MinHashBuilder(), corpus_fingerprint_builder()
+    with open(file_path, 'rb') as f:
+        text, content_hash = extract_text_from_stream(
+            f, member.lower(), (signature_builder, corpus_builder)
+        )
+    signature = signature_builder.signature()
+    return (file_path, content_hash, text, text_hash(text), tokenize(text).tobytes(),
+            signature.tobytes(), lsh_band_keys(signature), corpus_builder.fingerprints())
+
+def list_import_files(source):
+    if os.path.isdir(source):
+        members = [
+            os.path.relpath(os.path.join(root, name), source).replace(os.sep, '/')
+            for root, _, names in os.walk(source) for name in names
+        ]
+    else:
+        with zipfile.ZipFile(source) as archive:
+            members = [info.filename for info in archive.infolist() if not info.is_dir()]
+    return sorted(
+        member for member in members
+        if member.lower().endswith(IMPORT_EXTENSIONS) and not member.startswith('__MACOSX/')
+    )
+
+def import_student_name(member):
+    parts = member.split('/')
+    return parts[0] if len(parts) > 1 else os.path.splitext(parts[0])[0]
+
+def insert_imported_batch(db, assignment_id, batch):
+    submissions, texts, streams, signatures, buckets, postings, documents = [], [], [], [], [], [], []
+    pipeline = token_pipeline()
+    for student_id, item in batch:
+        file_path, content_hash, text, tokens_hash, tokens, signature, band_keys, fingerprints = item
+        cursor = db.execute(
+            'INSERT INTO submissions (assignment_id, student_id, file_path, content_hash) VALUES (?, ?, ?, ?)',
+            (assignment_id, student_id, file_path, content_hash)
+        )
+        submission_id = cursor.lastrowid
+        texts.append((content_hash, text))
+        streams.append((tokens_hash, pipeline, len(tokens) // 4, tokens))
+        signatures.append((submission_id, assignment_id, signature))
+        buckets.extend((assignment_id, band, bucket, submission_id) for band, bucket in band_keys)
+        postings.extend((fingerprint, submission_id) for fingerprint in fingerprints)
+        documents.append((submission_id, len(fingerprints)))
+    
+    db.executemany('INSERT OR IGNORE INTO document_texts (content_hash, text) VALUES (?, ?)', texts)
+    db.executemany(
+        'INSERT OR REPLACE INTO token_streams (text_hash, pipeline, token_count, tokens) VALUES (?, ?, ?, ?)',
+        streams
+    )
+    db.executemany(
+        'INSERT OR REPLACE INTO submission_signatures (submission_id, assignment_id, signature) VALUES (?, ?, ?)',
+        signatures
+    )
+    db.executemany(
+        'INSERT OR IGNORE INTO lsh_buckets (assignment_id, band, bucket, submission_id) VALUES (?, ?, ?, ?)',
+        buckets
+    )
+    db.executemany(
+        'INSERT OR IGNORE INTO fingerprint_postings (fingerprint, submission_id) VALUES (?, ?)',
+        postings
+    )
+    db.executemany(
+        'INSERT OR REPLACE INTO fingerprint_documents (submission_id, fingerprint_count) VALUES (?, ?)',
+        documents
+    )
+    db.commit()
+    query_cache.invalidate('submissions')
+
+@app.cli.command('import-submissions')
+@click.argument('assignment_id', type=int)
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--batch-size', type=int, default=None, help='Submissions per transaction.')
+@click.option('--analyze/--no-analyze', default=True, help='Score the assignment after the import.')
+def import_submissions_command(assignment_id, source, batch_size, analyze):
+    """Import a zip file or directory of submissions into an assignment."""
+    db = get_db()
+    if not db.execute('SELECT id FROM assignments WHERE id = ?', (assignment_id,)).fetchone():
+        raise click.ClickException(f'Ödev bulunamadı: {assignment_id}')
+    if not os.path.isdir(source) and not zipfile.is_zipfile(source):
+        raise click.ClickException('Kaynak bir zip dosyası ya da klasör olmalı')
+    
+    students = {row['username']: row['id'] for row in db.execute(
+        "SELECT id, username FROM users WHERE role = 'student'"
+    )}
+    imported = {row['file_path'] for row in db.execute(
+        'SELECT file_path FROM submissions WHERE assignment_id = ?', (assignment_id,)
+    )}
+    
+    items, owners, unknown = [], [], set()
+    members = list_import_files(source)
+    for member in members:
+        student_name = import_student_name(member)
+        if student_name not in students:
+            unknown.add(student_name)
+            continue
+        student_id = students[student_name]
+        member_key = hashlib.sha256(member.encode('utf-8')).hexdigest()[:12]
+        file_path = os.path.join(
+            app.config['UPLOAD_FOLDER'],
+            f"sub_{student_id}_{assignment_id}_{member_key}_{secure_filename(os.path.basename(member))}"
+        )
+        if file_path in imported:
+            click.echo(f'Zaten içe aktarılmış, atlandı: {member}', err=True)
+            continue
+        imported.add(file_path)
+        items.append((member, file_path))
+        owners.append(student_id)
+    
+    for student_name in sorted(unknown):
+        click.echo(f'Öğrenci bulunamadı, atlandı: {student_name}', err=True)
+    skipped = len(members) - len(items)
+    click.echo(f'{len(items)} dosya içe aktarılacak, {skipped} dosya atlandı')
+    
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    workers = app.config['ANALYSIS_WORKERS'] or os.cpu_count() or 1
+    batch = []
+    # Forkserver workers, as in score_pairs: this process holds pooled
+    # SQLite connections and may run job threads
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('forkserver'),
+                             initializer=_init_import_worker,
+                             initargs=(dict(app.config), source)) as executor, \
+            click.progressbar(length=len(items), label='İçe aktarılıyor') as bar:
+        results = executor.map(_extract_import_file, items,
+                               chunksize=max(1, len(items) // (workers * 4)))
+        for student_id, result in zip(owners, results):
+            batch.append((student_id, result))
+            if len(batch) >= batch_size:
+                insert_imported_batch(db, assignment_id, batch)
+                bar.update(len(batch))
+                batch = []
+        if batch:
+            insert_imported_batch(db, assignment_id, batch)
+            bar.update(len(batch))
+    
+    if analyze and items:
+        click.echo(f'{analyze_assignment(assignment_id)} benzerlik skoru hesaplandı')
+
+# Keyset Pagination
+# Listings are ordered by (timestamp, id) descending; the cursor is the last
+# row of the previous page, so every page is an index range scan.
+def decode_cursor(value):
+    if not value:
+        return None
+    timestamp, _, row_id = value.rpartition('|')
+    try:
+        return timestamp, int(row_id)
+    except ValueError:
+        return None
+
+def paginate(rows, column):
+    next_cursor = None
+    if len(rows) > app.config['PAGE_SIZE']:
+        rows = rows[:app.config['PAGE_SIZE']]
+        next_cursor = f"{rows[-1][column]}|{rows[-1]['id']}"
+    return rows, next_cursor
+
+# User Cache
+# Sessions carry only the user id. Id, username and role come from an LRU
+# of __slots__ records keyed by id, so decorators, templates and listings
+# don't query users for a name. Usernames and roles never change after
+# registration, so entries are never invalidated.
+class UserRecord:
+    __slots__ = ('id', 'username', 'role')
+
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+user_cache = LRUCache(app.config['USER_CACHE_SIZE'])
+
+def cache_user(row):
+    user = UserRecord(row['id'], row['username'], row['role'])
+    user_cache.set(user.id, user)
+    return user
+
+def get_users(user_ids):
+    users, missing = {}, []
+    for user_id in set(user_ids):
+        user = user_cache.get(user_id)
+        if user is not None:
+            users[user_id] = user
+        elif user_id is not None:
+            missing.append(user_id)
+    if missing:
+        rows = get_db().execute(
+            'SELECT id, username, role FROM users WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps(missing),)
+        ).fetchall()
+        for row in rows:
+            users[row['id']] = cache_user(row)
+    return users
+
+def get_user(user_id):
+    return get_users([user_id]).get(user_id)
+
+def load_current_user():
+    if 'current_user' not in g:
+        g.current_user = get_user(session.get('user_id'))
+    return g.current_user
+
+current_user = LocalProxy(load_current_user)
+
+def attach_usernames(rows, **columns):
+    # attach_usernames(rows, student_name='student_id') returns the rows as
+    # dicts with each name looked up from its id column
+    rows = [dict(row) for row in rows]
+    users = get_users(row[column] for row in rows for column in columns.values())
+    for row in rows:
+        for name, column in columns.items():
+            user = users.get(row[column])
+            row[name] = user.username if user else None
+    return rows
+
+@app.context_processor
+def inject_current_user():
+    return {'current_user': current_user}
+
+# Password Hashing
+# PASSWORD_HASH_METHOD is a werkzeug method spec including its cost, e.g.
+# 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Hashes made with any other
+# method or cost are replaced the next time their owner logs in.
+@timed('password_hash')
+def hash_password(password):
+    return generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+
+@timed('password_hash')
+def verify_password(stored, password):
+    return check_password_hash(stored, password)
+
+@lru_cache(maxsize=None)
+def password_hash_prefix(method):
+    # werkzeug fills in the cost parameters a method leaves out ('scrypt' is
+    # stored as 'scrypt:32768:8:1'); its own output is the canonical form
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def password_needs_rehash(stored):
+    return stored.split('$', 1)[0] != password_hash_prefix(app.config['PASSWORD_HASH_METHOD'])
+
+# Login Throttling
+# Sliding-window counters kept in memory per process: every attempt counts
+# against the client address, failed ones against the username. Requests
+# over either limit are refused before any password is hashed.
+class SlidingWindowLimiter:
+    def __init__(self, limit, window, maxsize):
+        self.limit = limit
+        self.window = window
+        self._events = LRUCache(maxsize)  # key -> deque of monotonic timestamps
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now, create=True):
+        # Only recording an event adds a key; lookups of unknown keys must
+        # not evict tracked ones from the LRU
+        events = self._events.get(key)
+        if events is None:
+            if not create:
+                return ()
+            events = deque()
+            self._events.set(key, events)
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        return events
+
+    def allow(self, key):
+        # Records the event unless the key is already at its limit
+        with self._lock:
+            now = time.monotonic()
+            events = self._recent(key, now)
+            if len(events) >= self.limit:
+                return False
+            events.append(now)
+            return True
+
+    def blocked(self, key):
+        with self._lock:
+            return len(self._recent(key, time.monotonic(), create=False)) >= self.limit
+
+    def hit(self, key):
+        with self._lock:
+            now = time.monotonic()
+            self._recent(key, now).append(now)
+
+    def reset(self, key):
+        self._events.pop(key)
+
+login_attempts = SlidingWindowLimiter(
+    app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_WINDOW'], app.config['LOGIN_TRACKED_KEYS']
+)
+login_failures = SlidingWindowLimiter(
+    app.config['LOGIN_MAX_FAILURES'], app.config['LOGIN_FAILURE_WINDOW'], app.config['LOGIN_TRACKED_KEYS']
+)
+
 # Decorators
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'username' not in session:
+        if not current_user:
             flash('Lütfen giriş yapınız', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -135,13 +2651,47 @@ def role_required(role):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if 'role' not in session or session['role'] != role:
+            if not current_user or current_user.role != role:
                 flash('Bu sayfaya erişim izniniz yok', 'error')
                 return redirect(url_for('login'))
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
+def conditional_page(*tags, state=None):
+    # ETag/Last-Modified for pages built from tagged cache entries. The ETag
+    # covers the viewer, the query string, the tag versions and any live
+    # `state`, so a repeat load is answered with a 304 before the view runs.
+    # Pages carrying flash messages are always rendered and never tagged.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if session.get('_flashes'):
+                return f(*args, **kwargs)
+            validator = repr((
+                CACHE_INSTANCE, request.endpoint, session.get('user_id'), request.query_string,
+                query_cache.versions(tags), state() if state else None,
+                int(time.time() // app.config['CACHE_TTL'])
+            ))
+            etag = hashlib.blake2b(validator.encode('utf-8'), digest_size=16).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+            response.set_etag(etag)
+            response.last_modified = query_cache.last_modified(tags)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return decorated_function
+    return decorator
+
+def active_analysis_jobs():
+    return [tuple(row) for row in get_db().execute('''
+        SELECT id, status, progress FROM jobs
+        WHERE status IN ('queued', 'running') AND kind = 'analyze_assignment'
+    ''')]
+
 # Routes
 @app.route('/')
 def index():
@@ -157,17 +2707,25 @@ def login():
             flash('Lütfen kullanıcı adı ve şifre giriniz', 'error')
             return redirect(url_for('login'))
             
+        if not login_attempts.allow(request.remote_addr) or login_failures.blocked(username):
+            flash('Çok fazla giriş denemesi. Lütfen birkaç dakika sonra tekrar deneyiniz', 'error')
+            return render_template('login.html'), 429
+            
         db = get_db()
         user = db.execute(
-            'SELECT * FROM users WHERE username = ?', (username,)
+            'SELECT id, username, password, role FROM users WHERE username = ?', (username,)
         ).fetchone()
         
-        if user and check_password_hash(user['password'], password):
+        if user and verify_password(user['password'], password):
+            login_failures.reset(username)
+            if password_needs_rehash(user['password']):
+                db.execute('UPDATE users SET password = ? WHERE id = ?', (hash_password(password), user['id']))
+                db.commit()
             session['user_id'] = user['id']
-            session['username'] = user['username']
-            session['role'] = user['role']
+            cache_user(user)
             return redirect(url_for(f"{user['role']}_dashboard"))
         else:
+            login_failures.hit(username)
             flash('Geçersiz kullanıcı adı veya şifre', 'error')
     
     return render_template('login.html')
@@ -187,9 +2745,10 @@ def register():
         try:
             db.execute(
                 'INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
-                (username, generate_password_hash(password), role)
+                (username, hash_password(password), role)
             )
             db.commit()
+            query_cache.invalidate('users')
             flash('Kayıt başarılı! Giriş yapabilirsiniz', 'success')
             return redirect(url_for('login'))
         except sqlite3.IntegrityError:
@@ -202,74 +2761,106 @@ def register():
 @role_required('teacher')
 def compare():
     score = None
+    job = None
     text1 = request.form.get('text1', '')
     text2 = request.form.get('text2', '')
+    engine = request.form.get('engine', app.config['SIMILARITY_ENGINE'])
+    
+    if request.args.get('job_id'):
+        # Result page of a queued comparison; only its creator may open it
+        job = get_job(request.args.get('job_id', type=int))
+        if not job or job['kind'] != 'compare_texts' or job['created_by'] != current_user.id:
+            flash('Karşılaştırma bulunamadı', 'error')
+            job = None
+        elif job['status'] == 'done':
+            score = json.loads(job['result'])['score']
     
     if request.method == 'POST':
         file1 = request.files.get('file1')
         file2 = request.files.get('file2')
 
+        # Uploads are read straight from the request stream
         if file1 and file1.filename:
-            filename = secure_filename(file1.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file1.save(file_path)
-            text1 = extract_text_from_file(file_path)
-            os.remove(file_path)
+            text1, _ = extract_text_from_stream(file1.stream, secure_filename(file1.filename))
             
         if file2 and file2.filename:
-            filename = secure_filename(file2.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file2.save(file_path)
-            text2 = extract_text_from_file(file_path)
-            os.remove(file_path)
+            text2, _ = extract_text_from_stream(file2.stream, secure_filename(file2.filename))
         
-        if text1 and text2:
-            score = calculate_similarity(text1, text2)
+        if text1 and text2 and len(text1) + len(text2) > app.config['COMPARE_INLINE_MAX_CHARS']:
+            # Large texts are scored off the request thread; the job payload
+            # references the texts through the blob store, and both are
+            # committed together so a history sweep never sees one without the other
+            db = get_db()
+            text1_hash, text2_hash = put_blob(db, text1), put_blob(db, text2)
+            job_id = enqueue_job('compare_texts', {
+                'user_id': current_user.id, 'text1_hash': text1_hash,
+                'text2_hash': text2_hash, 'engine': engine
+            }, created_by=current_user.id, unique=False)
+            return redirect(url_for('compare', job_id=job_id))
+        elif text1 and text2:
+            score = calculate_similarity(text1, text2, engine)
             
             # Save comparison to database
-            db = get_db()
-            db.execute(
-                'INSERT INTO comparisons (user_id, text1, text2, score) VALUES (?, ?, ?, ?)',
-                (session['user_id'], text1, text2, score)
-            )
-            db.commit()
+            record_comparison(current_user.id, text1, text2, score)
         else:
             flash('Lütfen iki metin veya dosya giriniz', 'error')
     
-    return render_template('compare.html', score=score, text1=text1, text2=text2)
+    return render_template('compare.html', score=score, text1=text1, text2=text2,
+                         engine=engine, engines=SIMILARITY_ENGINES.values(), job=job)
 
 # ====================== TEACHER ROUTES ======================
 @app.route('/teacher_dashboard')
 @login_required
 @role_required('teacher')
+@conditional_page('assignments', 'scores', 'submissions', 'users', state=active_analysis_jobs)
 def teacher_dashboard():
-    db = get_db()
-    
-    # Get assignments created by this teacher
-    assignments = db.execute(
-        'SELECT * FROM assignments WHERE teacher_id = ? ORDER BY created_at DESC',
-        (session['user_id'],)
-    ).fetchall()
+    # Get assignments created by this teacher, with their precomputed analysis
+    assignments = cached_query(('teacher_assignments', current_user.id), ('assignments', 'scores'), '''
+        SELECT a.*, COUNT(sc.score) as pair_count, MAX(sc.score) as max_score,
+               SUM(sc.score >= 75) as high_risk_count
+        FROM assignments a
+        LEFT JOIN similarity_scores sc ON sc.assignment_id = a.id
+        WHERE a.teacher_id = ?
+        GROUP BY a.id
+        ORDER BY a.created_at DESC
+    ''', (current_user.id,))
     
     # Get recent submissions (last active students)
-    recent_submissions = db.execute('''
-        SELECT s.*, u.username as student_name, a.name as assignment_name
+    recent_submissions = attach_usernames(cached_query(('recent_submissions',), ('submissions', 'assignments'), '''
+        SELECT s.*, a.name as assignment_name
         FROM submissions s
-        JOIN users u ON s.student_id = u.id
         JOIN assignments a ON s.assignment_id = a.id
         ORDER BY s.submitted_at DESC
         LIMIT 10
-    ''').fetchall()
+    '''), student_name='student_id')
     
-    # Get all students
-    students = db.execute(
-        'SELECT id, username FROM users WHERE role = "student" ORDER BY username'
-    ).fetchall()
+    # Highest scoring pairs across this teacher's assignments
+    risk_pairs = query_cache.get_or_set(
+        ('risk_pairs', current_user.id), ('scores', 'submissions'),
+        lambda: get_risk_pairs(current_user.id, app.config['RISK_PAIR_LIMIT'])
+    )
+    
+    # Analysis jobs still queued or running, per assignment
+    analysis_jobs = {}
+    for assignment in assignments:
+        job = get_active_job('analyze_assignment', {'assignment_id': assignment['id']})
+        if job:
+            analysis_jobs[assignment['id']] = job
+    
+    # Student <option> list, rendered once and shared by both selects
+    student_options = query_cache.get_or_set(('student_options',), ('users',), lambda: Markup(
+        render_template('_student_options.html', students=get_db().execute(
+            'SELECT id, username FROM users WHERE role = "student" ORDER BY username'
+        ).fetchall())
+    ))
     
     return render_template('teacher_dashboard.html',
                          assignments=assignments,
                          recent_submissions=recent_submissions,
-                         students=students)
+                         risk_pairs=risk_pairs,
+                         student_options=student_options,
+                         engines=SIMILARITY_ENGINES.values(),
+                         analysis_jobs=analysis_jobs)
 
 @app.route('/upload_assignment', methods=['POST'])
 @login_required
@@ -278,6 +2869,9 @@ def upload_assignment():
     if request.method == 'POST':
         assignment_name = request.form.get('assignment_name')
         assignment_file = request.files.get('assignment_file')
+        similarity_engine = request.form.get('similarity_engine')
+        if similarity_engine not in SIMILARITY_ENGINES:
+            similarity_engine = app.config['SIMILARITY_ENGINE']
         
         if not assignment_name or not assignment_file:
             flash('Lütfen tüm alanları doldurunuz', 'error')
@@ -289,11 +2883,15 @@ def upload_assignment():
                 raise ValueError("Dosya yüklenemedi")
             
             db = get_db()
-            db.execute(
-                'INSERT INTO assignments (teacher_id, name) VALUES (?, ?)',
-                (session['user_id'], assignment_name)
+            cursor = db.execute(
+                'INSERT INTO assignments (teacher_id, name, similarity_engine) VALUES (?, ?, ?)',
+                (current_user.id, assignment_name, similarity_engine)
             )
             db.commit()
+            query_cache.invalidate('assignments')
+            enqueue_job('extract_assignment',
+                        {'assignment_id': cursor.lastrowid, 'file_path': file_path},
+                        created_by=current_user.id)
             flash('Ödev başarıyla yüklendi!', 'success')
         except Exception as e:
             app.logger.error(f"Error uploading assignment: {e}")
@@ -301,6 +2899,20 @@ def upload_assignment():
     
     return redirect(url_for('teacher_dashboard'))
 
+@app.route('/analyze_assignment/<int:assignment_id>', methods=['POST'])
+@login_required
+@role_required('teacher')
+def analyze_assignment_route(assignment_id):
+    try:
+        enqueue_job('analyze_assignment', {'assignment_id': assignment_id},
+                    created_by=current_user.id)
+        flash('Analiz kuyruğa alındı', 'success')
+    except Exception as e:
+        app.logger.error(f"Analysis error: {str(e)}")
+        flash('Analiz başlatılırken bir hata oluştu', 'error')
+    
+    return redirect(url_for('teacher_dashboard'))
+
 @app.route('/compare_assignments', methods=['POST'])
 @login_required
 @role_required('teacher')
@@ -318,7 +2930,7 @@ def compare_assignments():
     
     try:
         # Build query for first submission
-        query1 = 'SELECT file_path FROM submissions WHERE assignment_id = ?'
+        query1 = 'SELECT id, file_path, content_hash FROM submissions WHERE assignment_id = ?'
         params1 = [assignment1_id]
         
         if student1_id:
@@ -328,7 +2940,7 @@ def compare_assignments():
         query1 += ' LIMIT 1'
         
         # Build query for second submission
-        query2 = 'SELECT file_path FROM submissions WHERE assignment_id = ?'
+        query2 = 'SELECT id, file_path, content_hash FROM submissions WHERE assignment_id = ?'
         params2 = [assignment2_id]
         
         if student2_id:
@@ -346,8 +2958,8 @@ def compare_assignments():
             return redirect(url_for('teacher_dashboard'))
         
         # Extract texts
-        text1 = extract_text_from_file(submission1['file_path'])
-        text2 = extract_text_from_file(submission2['file_path'])
+        text1 = get_submission_text(submission1)
+        text2 = get_submission_text(submission2)
         
         if not text1 or not text2:
             flash('Dosyalardan metin çıkarılamadı', 'error')
@@ -357,11 +2969,7 @@ def compare_assignments():
         score = calculate_similarity(text1, text2)
         
         # Save comparison
-        db.execute(
-            'INSERT INTO comparisons (user_id, text1, text2, score) VALUES (?, ?, ?, ?)',
-            (session['user_id'], text1[:500], text2[:500], score)
-        )
-        db.commit()
+        record_comparison(current_user.id, text1, text2, score)
         
         flash(f'Benzerlik skoru: {score}%', 'success')
         
@@ -379,9 +2987,8 @@ def examine_submission(submission_id):
     
     # Get submission details with student and assignment info
     submission = db.execute('''
-        SELECT s.*, u.username as student_name, a.name as assignment_name
+        SELECT s.*, a.name as assignment_name, a.similarity_engine
         FROM submissions s
-        JOIN users u ON s.student_id = u.id
         JOIN assignments a ON s.assignment_id = a.id
         WHERE s.id = ?
     ''', (submission_id,)).fetchone()
@@ -389,25 +2996,39 @@ def examine_submission(submission_id):
     if not submission:
         flash('Gönderim bulunamadı', 'error')
         return redirect(url_for('teacher_dashboard'))
+    submission, = attach_usernames([submission], student_name='student_id')
     
-    # Extract text from the file
-    submission_text = extract_text_from_file(submission['file_path'])
+    analysis_job = None
+    if submission['scored_at']:
+        # Read the stored pairwise scores
+        scores = dict(get_precomputed_scores(submission_id, 3))
+    else:
+        # Score this submission in the background; meanwhile score the
+        # likely matches from the fingerprint index
+        analysis_job = get_job(enqueue_job(
+            'score_submission', {'submission_id': submission_id},
+            created_by=current_user.id
+        ))
+        scores = {candidate_id: None for candidate_id, _ in find_candidates(submission)}
     
-    # Get all submissions for the same assignment (excluding current one)
-    other_submissions = db.execute('''
-        SELECT s2.id, s2.file_path, s2.submitted_at, u.username as student_name
+    placeholders = ', '.join('?' * len(scores))
+    other_submissions = attach_usernames(db.execute(f'''
+        SELECT s2.id, s2.file_path, s2.content_hash, s2.submitted_at, s2.student_id
         FROM submissions s2
-        JOIN users u ON s2.student_id = u.id
-        WHERE s2.assignment_id = ? AND s2.id != ?
-    ''', (submission['assignment_id'], submission_id)).fetchall()
+        WHERE s2.id IN ({placeholders})
+    ''', list(scores)).fetchall(), student_name='student_id')
+    
+    # Extract the texts concurrently, then calculate exact similarity, in one
+    # batch, for candidates without a stored score
+    unscored = [sub for sub in other_submissions if scores[sub['id']] is None]
+    submission_text, *unscored_texts = get_submission_texts([submission] + unscored)
+    similarities = calculate_similarities(submission_text, unscored_texts, submission['similarity_engine'])
+    scores.update(zip([sub['id'] for sub in unscored], similarities))
     
-    # Calculate similarity for each submission
     similar_submissions = []
-    current_text = extract_text_from_file(submission['file_path'])
     
     for sub in other_submissions:
-        other_text = extract_text_from_file(sub['file_path'])
-        similarity = calculate_similarity(current_text, other_text)
+        similarity = scores[sub['id']]
         similar_submissions.append({
             'id': sub['id'],
             'file_path': sub['file_path'],
@@ -422,7 +3043,82 @@ def examine_submission(submission_id):
     return render_template('examine.html', 
                          submission=submission,
                          submission_text=submission_text,
-                         similar_submissions=similar_submissions)
+                         similar_submissions=similar_submissions,
+                         analysis_job=analysis_job)
+
+@app.route('/submissions')
+@login_required
+@role_required('teacher')
+def submissions_list():
+    db = get_db()
+    assignment_id = request.args.get('assignment_id', type=int)
+    cursor = decode_cursor(request.args.get('before'))
+    
+    conditions = []
+    params = []
+    if assignment_id:
+        conditions.append('s.assignment_id = ?')
+        params.append(assignment_id)
+    if cursor:
+        conditions.append('(s.submitted_at, s.id) < (?, ?)')
+        params.extend(cursor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
+    submissions = db.execute(f'''
+        SELECT s.id, s.submitted_at, s.assignment_id, s.student_id, a.name as assignment_name
+        FROM submissions s
+        JOIN assignments a ON s.assignment_id = a.id
+        {where}
+        ORDER BY s.submitted_at DESC, s.id DESC
+        LIMIT ?
+    ''', params + [app.config['PAGE_SIZE'] + 1]).fetchall()
+    submissions, next_cursor = paginate(submissions, 'submitted_at')
+    submissions = attach_usernames(submissions, student_name='student_id')
+    
+    assignments = db.execute(
+        'SELECT id, name FROM assignments WHERE teacher_id = ? ORDER BY created_at DESC',
+        (current_user.id,)
+    ).fetchall()
+    
+    return render_template('submissions.html',
+                         submissions=submissions,
+                         assignments=assignments,
+                         assignment_id=assignment_id,
+                         next_cursor=next_cursor)
+
+@app.route('/search', methods=['GET', 'POST'])
+@login_required
+@role_required('teacher')
+def search():
+    text = request.form.get('text', '')
+    submission = None
+    results = None
+    
+    submission_id = request.args.get('submission_id', type=int)
+    if submission_id:
+        # Search with the text of a stored submission
+        submission = get_db().execute('''
+            SELECT s.*, a.name as assignment_name
+            FROM submissions s
+            JOIN assignments a ON s.assignment_id = a.id
+            WHERE s.id = ?
+        ''', (submission_id,)).fetchone()
+        if not submission:
+            flash('Gönderim bulunamadı', 'error')
+            return redirect(url_for('search'))
+        submission, = attach_usernames([submission], student_name='student_id')
+        text = get_submission_text(submission)
+    
+    if request.method == 'POST' or submission:
+        if text:
+            results = search_corpus(text, exclude_id=submission_id)
+        else:
+            flash('Lütfen aranacak metni giriniz', 'error')
+    
+    return render_template('search.html',
+                         text=text if not submission else '',
+                         submission=submission,
+                         results=results)
 
 @app.route('/download/<int:submission_id>')
 @login_required
@@ -447,28 +3143,42 @@ def compare_submissions(submission1_id, submission2_id):
     
     # Get both submissions
     submission1 = db.execute(
-        'SELECT s.*, u.username as student_name FROM submissions s JOIN users u ON s.student_id = u.id WHERE s.id = ?', 
+        '''SELECT s.*, a.similarity_engine
+           FROM submissions s JOIN assignments a ON s.assignment_id = a.id WHERE s.id = ?''', 
         (submission1_id,)
     ).fetchone()
     submission2 = db.execute(
-        'SELECT s.*, u.username as student_name FROM submissions s JOIN users u ON s.student_id = u.id WHERE s.id = ?', 
+        'SELECT * FROM submissions WHERE id = ?', 
         (submission2_id,)
     ).fetchone()
     
     if not submission1 or not submission2:
         flash('Gönderimler bulunamadı', 'error')
         return redirect(url_for('teacher_dashboard'))
+    submission1, submission2 = attach_usernames([submission1, submission2], student_name='student_id')
     
     # Extract texts
-    text1 = extract_text_from_file(submission1['file_path'])
-    text2 = extract_text_from_file(submission2['file_path'])
+    text1, text2 = get_submission_texts([submission1, submission2])
     
-    # Calculate similarity
-    score = calculate_similarity(submission1['file_path'], submission2['file_path'])
+    # Use the stored score when the pair has one, otherwise score the texts
+    stored = db.execute(
+        'SELECT score FROM similarity_scores WHERE submission1_id = ? AND submission2_id = ?',
+        (min(submission1_id, submission2_id), max(submission1_id, submission2_id))
+    ).fetchone()
+    if stored:
+        score = stored['score']
+    else:
+        score = calculate_similarity(text1, text2, submission1['similarity_engine'])
+    
+    # Matching passages, as character ranges in each text
+    spans = get_passage_alignment(submission1, submission2)
     
     return render_template('compare_submissions.html',
                          submission1=submission1,
                          submission2=submission2,
+                         segments1=highlight_segments(text1, [(s[0], s[1]) for s in spans]),
+                         segments2=highlight_segments(text2, [(s[2], s[3]) for s in spans]),
+                         passage_count=len(spans),
                          text1=text1,
                          text2=text2,
                          score=score)
@@ -477,27 +3187,33 @@ def compare_submissions(submission1_id, submission2_id):
 @app.route('/student_dashboard')
 @login_required
 @role_required('student')
+@conditional_page('assignments', 'submissions')
 def student_dashboard():
-    db = get_db()
-    
     # Get all available assignments
-    assignments = db.execute(
+    assignments = cached_query(
+        ('all_assignments',), ('assignments',),
         'SELECT * FROM assignments ORDER BY created_at DESC'
-    ).fetchall()
+    )
     
-    # Get student's submissions
-    submissions = db.execute(
-        '''SELECT s.*, a.name as assignment_name 
+    # Get student's submissions, one page at a time
+    cursor = decode_cursor(request.args.get('before'))
+    keyset = 'AND (s.submitted_at, s.id) < (?, ?)' if cursor else ''
+    submissions = cached_query(
+        ('student_submissions', current_user.id, cursor), ('submissions', 'assignments'),
+        f'''SELECT s.*, a.name as assignment_name 
            FROM submissions s 
            JOIN assignments a ON s.assignment_id = a.id 
-           WHERE student_id = ? 
-           ORDER BY submitted_at DESC''',
-        (session['user_id'],)
-    ).fetchall()
+           WHERE s.student_id = ? {keyset}
+           ORDER BY s.submitted_at DESC, s.id DESC
+           LIMIT ?''',
+        [current_user.id] + list(cursor or ()) + [app.config['PAGE_SIZE'] + 1]
+    )
+    submissions, next_cursor = paginate(submissions, 'submitted_at')
     
     return render_template('student_dashboard.html',
                          assignments=assignments,
-                         submissions=submissions)
+                         submissions=submissions,
+                         next_cursor=next_cursor)
 
 @app.route('/submit_assignment', methods=['POST'])
 @login_required
@@ -527,18 +3243,21 @@ def submit_assignment():
             filename = secure_filename(homework_file.filename)
             file_path = os.path.join(
                 app.config['UPLOAD_FOLDER'],
-                f"sub_{session['user_id']}_{assignment_id}_{filename}"
+                f"sub_{current_user.id}_{assignment_id}_{filename}"
             )
             homework_file.save(file_path)
             
-            # Save to database
-            db.execute(
+            # Save to database; text extraction and fingerprinting run as a job
+            cursor = db.execute(
                 '''INSERT INTO submissions 
                    (assignment_id, student_id, file_path) 
                    VALUES (?, ?, ?)''',
-                (assignment_id, session['user_id'], file_path)
+                (assignment_id, current_user.id, file_path)
             )
             db.commit()
+            query_cache.invalidate('submissions')
+            enqueue_job('extract_submission', {'submission_id': cursor.lastrowid},
+                        created_by=current_user.id)
             flash('Ödev başarıyla gönderildi!', 'success')
         except Exception as e:
             app.logger.error(f"Error submitting assignment: {str(e)}")
@@ -547,29 +3266,82 @@ def submit_assignment():
     return redirect(url_for('student_dashboard'))
 
 # ====================== SHARED ROUTES ======================
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized', 401
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job or (current_user.role != 'teacher' and job['created_by'] != current_user.id):
+        return jsonify({'error': 'not found'}), 404
+    
+    return jsonify({
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'attempts': job['attempts'],
+        'error': job['error'],
+        'result': json.loads(job['result']) if job['result'] else None,
+    })
+
 @app.route('/history')
 @login_required
 @role_required('teacher')
 def history():
     db = get_db()
+    cursor = decode_cursor(request.args.get('before'))
+    keyset = '(c.created_at, c.id) < (?, ?)' if cursor else '1'
+    params = list(cursor or ())
     
-    if session['role'] == 'teacher':
-        comparisons = db.execute('''
-            SELECT c.*, u.username as user 
+    if current_user.role == 'teacher':
+        comparisons = db.execute(f'''
+            SELECT c.id, c.score, c.created_at, c.user_id
             FROM comparisons c
-            JOIN users u ON c.user_id = u.id
-            ORDER BY c.created_at DESC
-            LIMIT 50
-        ''').fetchall()
+            WHERE {keyset}
+            ORDER BY c.created_at DESC, c.id DESC
+            LIMIT ?
+        ''', params + [app.config['PAGE_SIZE'] + 1]).fetchall()
     else:
-        comparisons = db.execute('''
-            SELECT * FROM comparisons 
-            WHERE user_id = ?
-            ORDER BY created_at DESC
-            LIMIT 50
-        ''', (session['user_id'],)).fetchall()
+        comparisons = db.execute(f'''
+            SELECT c.id, c.score, c.created_at FROM comparisons c
+            WHERE c.user_id = ? AND {keyset}
+            ORDER BY c.created_at DESC, c.id DESC
+            LIMIT ?
+        ''', [current_user.id] + params + [app.config['PAGE_SIZE'] + 1]).fetchall()
+    
+    comparisons, next_cursor = paginate(comparisons, 'created_at')
+    if current_user.role == 'teacher':
+        comparisons = attach_usernames(comparisons, user='user_id')
+    return render_template('history.html', history=comparisons, next_cursor=next_cursor)
+
+@app.route('/history/<int:comparison_id>')
+@login_required
+@role_required('teacher')
+def comparison_detail(comparison_id):
+    comparison = get_db().execute(
+        'SELECT * FROM comparisons WHERE id = ?', (comparison_id,)
+    ).fetchone()
     
-    return render_template('history.html', history=comparisons)
+    if not comparison:
+        flash('Karşılaştırma bulunamadı', 'error')
+        return redirect(url_for('history'))
+    comparison, = attach_usernames([comparison], user='user_id')
+    
+    # Texts are only loaded when a comparison is opened; rows from before the
+    # blob store still carry them inline
+    text1 = get_blob(comparison['text1_hash']) if comparison['text1_hash'] else comparison['text1']
+    text2 = get_blob(comparison['text2_hash']) if comparison['text2_hash'] else comparison['text2']
+    
+    return render_template('comparison_detail.html',
+                         comparison=comparison,
+                         text1=text1,
+                         text2=text2)
 
 @app.route('/clear_history', methods=['POST'])
 @login_required
@@ -577,6 +3349,7 @@ def history():
 def clear_history():
     db = get_db()
     db.execute('DELETE FROM comparisons')
+    delete_orphan_blobs(db)
     db.commit()
     flash('Karşılaştırma geçmişi temizlendi', 'success')
     return redirect(url_for('history'))
@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from app import app
+
+# ASGI Entry Point
+# The Flask app stays synchronous; asgiref runs every request on a worker
+# thread so blocking extraction and scoring never stall the event loop.
+# WsgiToAsgi alone funnels all requests through one shared thread; here they
+# share a pool of ASGI_THREADS threads, so one process serves many teacher
+# sessions at once while a burst of uploads waits for a free thread instead
+# of opening a thread and a pooled SQLite connection each.
+#
+#   pip install uvicorn
+#   uvicorn asgi:asgi_app --workers 4
+#   python asgi.py
+request_executor = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS'], thread_name_prefix='asgi')
+
+class BoundedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.run_wsgi_app.__wrapped__, thread_sensitive=False, executor=request_executor
+    )
+
+class ConcurrentWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await BoundedWsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+asgi_app = ConcurrentWsgiToAsgi(app)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(
+        'asgi:asgi_app',
+        host=os.environ.get('HOST', '127.0.0.1'),
+        port=int(os.environ.get('PORT', 8000)),
+        workers=int(os.environ.get('WEB_CONCURRENCY', 1))
+    )
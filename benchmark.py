@@ -0,0 +1,236 @@
+import os
+import io
+import json
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import click
+
+# Benchmark Suite
+# Builds a synthetic corpus in a throwaway directory, loads it through the
+# app and times extraction, scoring, top-K retrieval and the teacher pages.
+# Results are JSON; pass --baseline to compare medians against an earlier run.
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --baseline bench.json
+
+def make_vocabulary(rng, size=5000):
+    letters = 'abcçdefgğhıijklmnoöprsştuüvyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def make_corpus(rng, documents, words, overlap):
+    # Every document copies roughly `overlap` of its words from a shared
+    # source, in place, so copied runs line up the way pasted passages do
+    vocabulary = make_vocabulary(rng)
+    source = [rng.choice(vocabulary) for _ in range(words)]
+    corpus = []
+    for _ in range(documents):
+        keep = rng.uniform(0, overlap * 2) if overlap else 0.0
+        corpus.append(' '.join(
+            source[i] if rng.random() < keep else rng.choice(vocabulary) for i in range(words)
+        ))
+    return corpus
+
+def write_document(path, text):
+    if path.endswith('.docx'):
+        from docx import Document
+        doc = Document()
+        words = text.split()
+        for start in range(0, len(words), 100):
+            doc.add_paragraph(' '.join(words[start:start + 100]))
+        doc.save(path)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'count': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'mean': statistics.fmean(ordered),
+    }
+
+def bench_extraction(appmod, corpus, workdir, repeat):
+    results = {}
+    for extension in ('.txt', '.docx'):
+        paths = []
+        for index, text in enumerate(corpus):
+            path = os.path.join(workdir, f'doc_{index}{extension}')
+            write_document(path, text)
+            paths.append(path)
+        results[f'extract{extension}'] = measure(
+            lambda: [appmod.extract_text_from_file(path) for path in paths], repeat
+        )
+        results[f'extract{extension}']['documents'] = len(paths)
+    return results
+
+def bench_scoring(appmod, corpus, engines, pairs, repeat):
+    rng = random.Random(0)
+    sample = [tuple(rng.sample(range(len(corpus)), 2)) for _ in range(pairs)]
+    results = {}
+    for engine in engines:
+        appmod.vector_cache.clear()
+        appmod.token_cache.clear()
+        appmod.text_hash_cache.clear()
+        results[f'pairwise.{engine}'] = measure(
+            lambda: [appmod.calculate_similarity(corpus[i], corpus[j], engine) for i, j in sample],
+            repeat
+        )
+        results[f'pairwise.{engine}']['pairs'] = len(sample)
+        results[f'one_vs_many.{engine}'] = measure(
+            lambda: appmod.calculate_similarities(corpus[0], corpus[1:], engine), repeat
+        )
+        results[f'one_vs_many.{engine}']['pairs'] = len(corpus) - 1
+    return results
+
+def load_corpus(appmod, client, corpus, workdir):
+    # Accounts go through the real routes; submissions use the bulk importer
+    client.post('/register', data={'username': 'bench_teacher', 'password': 'bench', 'role': 'teacher'})
+    source = os.path.join(workdir, 'submissions')
+    for index, text in enumerate(corpus):
+        username = f'bench_student_{index}'
+        client.post('/register', data={'username': username, 'password': 'bench', 'role': 'student'})
+        os.makedirs(os.path.join(source, username))
+        write_document(os.path.join(source, username, 'odev.txt'), text)
+
+    client.post('/login', data={'username': 'bench_teacher', 'password': 'bench'})
+    client.post('/upload_assignment', data={
+        'assignment_name': 'Benchmark',
+        'assignment_file': (io.BytesIO(b'benchmark'), 'benchmark.txt'),
+    }, content_type='multipart/form-data')
+
+    started = time.perf_counter()
+    result = appmod.app.test_cli_runner().invoke(args=['import-submissions', '1', source])
+    if result.exit_code:
+        raise click.ClickException(result.output or str(result.exception))
+    return {'import': summarize([time.perf_counter() - started])}
+
+def bench_top_k(appmod, documents, repeat):
+    results = {}
+    with appmod.app.app_context():
+        db = appmod.get_db()
+        submissions = db.execute('SELECT id, assignment_id FROM submissions').fetchall()
+        results['lsh_candidates'] = measure(
+            lambda: [appmod.find_candidates(sub) for sub in submissions], repeat
+        )
+        results['precomputed_top_k'] = measure(
+            lambda: [appmod.get_precomputed_scores(sub['id'], appmod.app.config['CANDIDATE_LIMIT'])
+                     for sub in submissions],
+            repeat
+        )
+        results['analyze_assignment'] = measure(lambda: appmod.analyze_assignment(1), 1)
+    for result in results.values():
+        result['documents'] = documents
+    return results
+
+def bench_routes(client, documents, repeat):
+    urls = {
+        'route.teacher_dashboard': '/teacher_dashboard',
+        'route.submissions': '/submissions?assignment_id=1',
+        'route.examine_submission': '/examine/1',
+        'route.compare_submissions': f'/compare_submissions/1/{documents}',
+        'route.search': '/search?submission_id=1',
+    }
+    results = {}
+    for name, url in urls.items():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise click.ClickException(f'{url} returned {response.status_code}')
+        results[name] = measure(lambda: client.get(url), repeat)
+    return results
+
+def compare_to_baseline(results, baseline, tolerance):
+    if baseline.get('parameters') != results['parameters']:
+        click.echo('Warning: baseline was run with different parameters', err=True)
+    regressions = []
+    for name, current in sorted(results['timings'].items()):
+        previous = baseline.get('timings', {}).get(name)
+        if not previous or not previous['median']:
+            continue
+        ratio = current['median'] / previous['median']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        click.echo(f'{name:40} {previous["median"] * 1000:10.2f}ms -> '
+                   f'{current["median"] * 1000:10.2f}ms  x{ratio:.2f}{flag}', err=True)
+    return regressions
+
+@click.command()
+@click.option('--documents', default=50, show_default=True, help='Documents in the synthetic corpus.')
+@click.option('--words', default=1000, show_default=True, help='Words per document.')
+@click.option('--overlap', default=0.3, show_default=True, help='Mean share of words copied from a common source.')
+@click.option('--pairs', default=100, show_default=True, help='Random pairs timed per engine.')
+@click.option('--repeat', default=5, show_default=True, help='Runs per measurement.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--engine', 'engines', multiple=True, help='Engines to time (default: all).')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write results here instead of stdout.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='Earlier results to compare against.')
+@click.option('--tolerance', default=0.2, show_default=True, help='Allowed median slowdown before failing.')
+def main(documents, words, overlap, pairs, repeat, seed, engines, output, baseline, tolerance):
+    """Benchmark extraction, similarity scoring, top-K retrieval and page latency."""
+    rng = random.Random(seed)
+    corpus = make_corpus(rng, documents, words, overlap)
+
+    # The app keeps its database and uploads relative to the working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app as appmod
+        appmod.app.config['TESTING'] = True
+        appmod.app.config['JOBS_INLINE'] = True
+        client = appmod.app.test_client()
+
+        timings = {}
+        timings.update(bench_extraction(appmod, corpus, workdir, repeat))
+        timings.update(bench_scoring(appmod, corpus, engines or list(appmod.SIMILARITY_ENGINES), pairs, repeat))
+        timings.update(load_corpus(appmod, client, corpus, workdir))
+        timings.update(bench_top_k(appmod, documents, repeat))
+        timings.update(bench_routes(client, documents, repeat))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'parameters': {
+            'documents': documents, 'words': words, 'overlap': overlap,
+            'pairs': pairs, 'repeat': repeat, 'seed': seed,
+        },
+        'environment': {
+            'python': sys.version.split()[0],
+            'numpy': appmod.np is not None,
+            'cpus': os.cpu_count(),
+        },
+        'timings': timings,
+    }
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        click.echo(json.dumps(results, indent=2))
+
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), tolerance)
+        if regressions:
+            raise click.ClickException(f'{len(regressions)} measurement(s) slower than the baseline')
+
+if __name__ == '__main__':
+    main()